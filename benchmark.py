@@ -0,0 +1,127 @@
+from loguru import logger
+import sys
+import time
+import tracemalloc
+
+logger.remove()
+
+from util.controller import Controller
+from logic.universe.universe import Universe
+
+
+def benchmark_memory(count=100_000):
+    """Memory allocated per ship when adding many ships to a universe."""
+    from logic.dso.ship import Tug
+    universe = Universe(Controller('Benchmark'))
+    admiral = universe.player
+    tracemalloc.start()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    for i in range(count):
+        admiral.add_ship(Tug, name=f'Benchmark {i}', parent=admiral.my_ship)
+    elapsed = time.perf_counter() - start_time
+    memory = tracemalloc.get_traced_memory()[0] - start_memory
+    tracemalloc.stop()
+    print(f'{count:,} ships: {memory / count:,.0f} bytes per ship ({memory / 2**20:,.1f} MiB, {elapsed:.2f} s)')
+
+
+def benchmark_projection(counts=(1_000, 10_000, 100_000, 1_000_000), repeat=20):
+    """Rotating points into camera space, with quaternions and with the cached rotation matrix."""
+    import numpy as np
+    from util.camera import Camera
+    from util._3d import Quaternion as Quat
+    camera = Camera()
+    camera.rotate(yaw=30, pitch=20, roll=10)
+    rng = np.random.default_rng()
+    for count in counts:
+        points = rng.normal(0, 10**6, size=(count, 3))
+        quat_ms = _time_ms(lambda: Quat.rotate_vectors(points - camera.pos, camera.rotation), repeat)
+        matrix_ms = _time_ms(lambda: camera.get_rotated_coords(points), repeat)
+        print(f'{count:>10,} points: quaternions {quat_ms:8.3f} ms, matrix {matrix_ms:8.3f} ms ({quat_ms / matrix_ms:.1f}x)')
+
+
+def benchmark_latlong(counts=(1_000, 10_000, 100_000, 1_000_000), repeat=20):
+    """Longitude and latitude of rotated points, into new arrays and into reused buffers."""
+    import numpy as np
+    from util.camera import Camera
+    from util._3d import latlong
+    camera = Camera()
+    rng = np.random.default_rng()
+    for count in counts:
+        points = rng.normal(0, 10**6, size=(count, 3))
+        points32 = points.astype(np.float32)
+        new_ms = _time_ms(lambda: latlong(points), repeat)
+        buffer_ms = _time_ms(lambda: camera.get_latlong(points), repeat)
+        buffer32_ms = _time_ms(lambda: camera.get_latlong(points32), repeat)
+        print(f'{count:>10,} points: new arrays {new_ms:8.3f} ms, buffers {buffer_ms:8.3f} ms, float32 buffers {buffer32_ms:8.3f} ms')
+
+
+def benchmark_culling(counts=(10_000, 100_000, 1_000_000), repeat=20):
+    """Projecting points to map pixels, with frustum culling alone and with the grid index."""
+    import numpy as np
+    from util.camera import Camera
+    from util.charmap import CharMap
+    from util.spatial import GridIndex
+    camera = Camera()
+    camera.rotate(yaw=30, pitch=20, roll=10)
+    camera.adjust_zoom(4)
+    charmap = CharMap(camera, (200, 60))
+    rng = np.random.default_rng()
+    for count in counts:
+        points = rng.normal(0, 10**6, size=(count, 3))
+        index = GridIndex(points, np.arange(count), cell_size=10**5)
+        culled_ms = _time_ms(lambda: charmap.get_projected_pixels(points), repeat)
+        indexed_ms = _time_ms(lambda: charmap.get_projected_pixels(
+            points, index.query(charmap.get_visible_cells(index))), repeat)
+        print(f'{count:>10,} points: frustum {culled_ms:8.3f} ms, grid index {indexed_ms:8.3f} ms ({index.cell_count:,} cells)')
+
+
+def benchmark_charmap(size=(300, 80), count=10_000, repeat=20):
+    """Drawing objects onto a full screen map and emitting its markup."""
+    import numpy as np
+    from util.camera import Camera
+    from util.charmap import CharMap
+    from logic.dso.classes import CLASS_ICONS, CLASS_COLORS, CLASS_TYPES
+    camera = Camera()
+    camera.adjust_zoom(0.5)
+    rng = np.random.default_rng()
+    points = rng.normal(0, 10**6, size=(count, 3))
+    class_ids = rng.integers(0, len(CLASS_ICONS), size=count)
+    icons, tags, priorities = CLASS_ICONS[class_ids], CLASS_COLORS[class_ids], CLASS_TYPES[class_ids]
+    for label in (None, lambda oid, dist: f'{oid} ({dist:.3e})'):
+        charmaps = []
+
+        def draw_objects():
+            charmap = CharMap(camera, size)
+            charmap.add_objects(points, icons, tags, label=label, priorities=priorities)
+            charmaps.append(charmap)
+
+        objects_ms = _time_ms(draw_objects, repeat)
+        draw_ms = _time_ms(lambda: charmaps[-1].draw(), repeat)
+        fragments = charmaps[-1].draw()
+        print(f'{size[0]}×{size[1]}, {count:,} objects, labels {label is not None:d}: objects {objects_ms:8.3f} ms, '
+              f'draw {draw_ms:8.3f} ms ({len(fragments):,} fragments)')
+
+
+def _time_ms(func, repeat):
+    func()
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        func()
+    return (time.perf_counter() - start_time) / repeat * 1000
+
+
+BENCHMARKS = {
+    'memory': benchmark_memory,
+    'projection': benchmark_projection,
+    'latlong': benchmark_latlong,
+    'culling': benchmark_culling,
+    'charmap': benchmark_charmap,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+    for name in names:
+        print(f'=== {name} ===')
+        BENCHMARKS[name]()
@@ -0,0 +1,99 @@
+from loguru import logger
+import asyncio
+import inspect
+import json
+import time
+from pathlib import Path
+
+from util.config import CONFIG_DATA
+
+
+MAX_LINE_SIZE = 2**24
+
+
+class ApiServer:
+    """
+    Local command API on a Unix socket, speaking JSON lines. Each request
+    line is a batch of commands, each a list of the command name followed
+    by its arguments:
+
+        [["sim.tick", "100"], ["objects", "--max", "5"]]
+
+    The batch is run in one turn of the event loop, and answered with a
+    line of the results and timing of each command.
+    """
+    def __init__(self, app, path):
+        self.app = app
+        self.path = Path(path)
+        self.server = None
+        self.batch_count = 0
+
+    async def start(self):
+        if self.path.is_socket():
+            self.path.unlink()
+        self.server = await asyncio.start_unix_server(
+            self.handle_client, path=str(self.path), limit=MAX_LINE_SIZE)
+        logger.info('API listening on {}', self.path)
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        if self.path.is_socket():
+            self.path.unlink()
+
+    async def handle_client(self, reader, writer):
+        logger.debug('API client connected')
+        try:
+            while line := await self.read_request(reader):
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response, default=str).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            logger.debug('API client disconnected')
+
+    @staticmethod
+    async def read_request(reader):
+        """The next request line, or empty when the client is done."""
+        try:
+            return await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            logger.warning('API request longer than {} bytes, disconnecting', MAX_LINE_SIZE)
+            return b''
+
+    async def handle_request(self, line):
+        start = time.perf_counter()
+        try:
+            batch = self.parse_batch(line)
+        except ValueError as e:
+            return {'error': str(e)}
+        results = self.app.universe.run_batch(batch)
+        # In split mode the results arrive from the simulation server
+        if inspect.isawaitable(results):
+            self.app.wake()
+            try:
+                results = await asyncio.wait_for(results, timeout=CONFIG_DATA['API_TIMEOUT'])
+            except asyncio.TimeoutError:
+                return {'error': f'No results within {CONFIG_DATA["API_TIMEOUT"]} seconds'}
+            except RuntimeError as e:
+                return {'error': str(e)}
+        self.batch_count += 1
+        self.app.wake()
+        return {'results': results, 'ms': (time.perf_counter() - start) * 1000}
+
+    @staticmethod
+    def parse_batch(line):
+        try:
+            batch = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON: {e}')
+        if not isinstance(batch, list):
+            raise ValueError('Batch must be a list of commands')
+        for command in batch:
+            if not isinstance(command, list) or not command:
+                raise ValueError(f'Command must be a non-empty list: {command}')
+            if not all(isinstance(arg, str) for arg in command):
+                raise ValueError(f'Command name and arguments must be strings: {command}')
+        return batch
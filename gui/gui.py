@@ -1,5 +1,6 @@
 from loguru import logger
 import sys
+import time
 import traceback
 import asyncio
 import prompt_toolkit
@@ -18,15 +19,20 @@ from prompt_toolkit.layout.layout import Layout
 from util import STYLE, restart_script, window_size
 from util.config import CONFIG_DATA
 from util.controller import Controller
+from util.logs import LOG_TAIL
 from gui.layout import DEFAULT_LAYOUT
 from gui.screenswitch import ScreenSwitcher
 from gui.prompt import Prompt
 from gui.keybinds import get_keybindings, encode_keyseq
+from gui.scheduler import FrameScheduler
+from gui.remote import RemoteUniverse
+from gui.api import ApiServer
 from logic.universe.universe import Universe
 
 FPS = CONFIG_DATA['FPS']
-FRAME_TIME = 1 / FPS
-logger.info(f'Running at {FPS} FPS ({FRAME_TIME*1000:.1f} ms)')
+LOGIC_FPS = CONFIG_DATA['LOGIC_FPS']
+IDLE_FPS = CONFIG_DATA['IDLE_FPS']
+logger.info(f'Rendering at {FPS} FPS ({IDLE_FPS} when idle), logic at {LOGIC_FPS} FPS')
 
 
 class App(Application):
@@ -34,9 +40,26 @@ class App(Application):
         prompt_toolkit.shortcuts.clear()
         prompt_toolkit.shortcuts.set_title('Space')
         self._last_key = ''
+        self._last_input_time = time.perf_counter()
+        self._loop = None
+        # Set by the logging thread, cleared by the next render frame
+        self._log_wake_pending = False
         self.controller = Controller('App')
-        self.universe = Universe(self.controller)
+        if CONFIG_DATA['SIMULATION_SERVER']:
+            self.universe = RemoteUniverse(self.controller)
+        else:
+            self.universe = Universe(self.controller)
         self.root_layout = self.get_layout()
+        # When idle, frames only run on a wake up or the heartbeat
+        # Logic frames are never dropped, render frames are when over budget
+        self.logic_scheduler = FrameScheduler('logic', self.universe.update, LOGIC_FPS,
+            idle_fps=IDLE_FPS, is_idle=self.is_idle, drop_frames=False)
+        self.render_scheduler = FrameScheduler('render', self.refresh_window, FPS,
+            idle_fps=IDLE_FPS, is_idle=self.is_idle)
+        self.prompt_window.prompt_input.buffer.on_text_changed += lambda buffer: self.wake()
+        self.api_server = None
+        if CONFIG_DATA['API_SOCKET']:
+            self.api_server = ApiServer(self, CONFIG_DATA['API_SOCKET'])
         self.register_commands()
         kb = get_keybindings(
             global_keys={'^ q': self.exit, '^ w': restart_script, 'escape': self.prompt_window.defocus},
@@ -88,6 +111,7 @@ class App(Application):
 
     # Handlers
     def handle_prompt_input(self, text):
+        self.wake()
         self.prompt_window.defocus()
         if not text:
             return
@@ -95,6 +119,7 @@ class App(Application):
 
     def handle_hotkey(self, key):
         self._last_key = key
+        self.wake()
         if key in CONFIG_DATA['HOTKEY_COMMANDS']:
             prompt_input = CONFIG_DATA['HOTKEY_COMMANDS'][key]
             self.handle_prompt_input(prompt_input)
@@ -103,6 +128,9 @@ class App(Application):
         size = self.screen_size if size is None else size
         return self.universe.get_window_content(name, size)
 
+    def get_versions(self, names):
+        return self.universe.get_versions(names)
+
     def user_feedback(self, message):
         self.universe.output_feedback(message)
 
@@ -122,6 +150,34 @@ class App(Application):
     def hotkeys_enabled(self):
         return not self.root_layout.buffer_has_focus
 
+    def is_idle(self):
+        """If nothing is moving on screen and there has been no recent input."""
+        if self.universe.is_animating:
+            return False
+        return time.perf_counter() - self._last_input_time > CONFIG_DATA['IDLE_DELAY']
+
+    def wake(self):
+        """Signal a change of state to the idle frame schedulers."""
+        self._last_input_time = time.perf_counter()
+        self.logic_scheduler.wake()
+        self.render_scheduler.wake()
+
+    def wake_from_log(self):
+        # Called from the logging thread, wakes once until the next render frame
+        if self._log_wake_pending:
+            return
+        if 'debug' in self.screen_switcher.current_screen.text_controls:
+            self._log_wake_pending = True
+            try:
+                self._loop.call_soon_threadsafe(self.render_scheduler.wake)
+            except RuntimeError:
+                # The event loop has closed
+                pass
+
+    def _on_resize(self):
+        super()._on_resize()
+        self.render_scheduler.wake()
+
     @property
     def screen_size(self):
         width = window_size().columns - 2
@@ -133,22 +189,27 @@ class App(Application):
         logger.debug(f'GUI debug called: {a}')
 
     # Runtime
-    async def logic_loop(self):
-        while True:
-            self.universe.update()
-            await asyncio.sleep(FRAME_TIME)
-
-    async def refresh_window(self):
-        while True:
-            self.screen_switcher.update()
-            self.prompt_window.update()
-            self.invalidate()
-            await asyncio.sleep(FRAME_TIME)
+    def refresh_window(self):
+        self._log_wake_pending = False
+        self.screen_switcher.update()
+        self.prompt_window.update()
+        self.invalidate()
 
     def run(self):
-        self.create_background_task(self.logic_loop())
-        self.create_background_task(self.refresh_window())
-        asyncio.get_event_loop().run_until_complete(self.run_async(pre_run=self.prerun))
+        self._loop = asyncio.get_event_loop()
+        self.create_background_task(self.logic_scheduler.run())
+        self.create_background_task(self.render_scheduler.run())
+        if self.api_server is not None:
+            self.create_background_task(self.api_server.start())
+        LOG_TAIL.listener = self.wake_from_log
+        try:
+            self._loop.run_until_complete(self.run_async(pre_run=self.prerun))
+        finally:
+            LOG_TAIL.listener = None
+            if self.api_server is not None:
+                self.api_server.close()
+            if isinstance(self.universe, RemoteUniverse):
+                self.universe.close()
 
     def prerun(self):
         self.prompt_window.defocus()
@@ -4,6 +4,7 @@ from util.layout import WSubLayout as WSub, HSubLayout as HSub, VSubLayout as VS
 from util.config import CONFIG_DATA
 
 aspect_ratio = CONFIG_DATA['ASPECT_RATIO']
+FPS = CONFIG_DATA['FPS']
 
 DEFAULT_LAYOUT = {
     'console': HSub([
@@ -43,6 +44,19 @@ DEFAULT_LAYOUT = {
     ]),
 }
 
+# Window name: (universe versions the content depends on, maximum refreshes per second)
+# Windows without known dependencies (None) are refreshed at their maximum rate
+WINDOW_REFRESH = {
+    'console': (('console',), FPS),
+    'feedback': (('feedback',), FPS),
+    'display': (('tick', 'camera', 'command', 'render'), FPS),
+    'cockpit': (('tick', 'camera', 'command', 'render'), 10),
+    'events': (('tick', 'events'), 5),
+    'browser': (None, 10),
+    'debug': (('log',), 5),
+}
+DEFAULT_WINDOW_REFRESH = None, FPS
+
 
 def export_layout(layouts):
     return {name: export_sublayout(sub) for name, sub in layouts.items()}
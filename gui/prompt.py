@@ -6,7 +6,7 @@ from prompt_toolkit.widgets import TextArea
 from prompt_toolkit.layout.controls import FormattedTextControl
 from prompt_toolkit.formatted_text import HTML
 
-from util import window_size, tag, format_latlong, format_vector, escape_html
+from util import window_size, tag, format_latlong, format_vector, escape_html, parse_markup
 from util._3d import latlong_single
 
 
@@ -30,7 +30,7 @@ class Prompt(HSplit):
             s = tag('darkbg', tag('bold', s))
         s = f'{s} '
         swidth, sheight = self.app.screen_size
-        self.prompt_text.content.text = HTML(s)
+        self.prompt_text.content.text = parse_markup(s)
         self.prompt_text.width = self.prompt_text.content.preferred_width(30)
         size = f'{window_size().columns}×{window_size().lines} ({swidth}×{sheight})'
         simrate = self.app.universe.auto_simrate
@@ -0,0 +1,179 @@
+from loguru import logger
+import asyncio
+import itertools
+import pickle
+import multiprocessing
+
+from util.config import CONFIG_DATA
+from util.logs import LOG_TAIL
+from util.shared import SharedFrames
+from gui.layout import WINDOW_REFRESH, DEFAULT_WINDOW_REFRESH
+from logic.universe.universe import PROMPT_LINE_SPLIT, PROMPT_LINE_SPLIT_ESCAPE
+from logic.universe.server import run_server
+
+
+# Windows drawn by the GUI process itself
+LOCAL_WINDOWS = {'debug'}
+
+
+class RemoteUniverse:
+    """
+    Stands in for the Universe in the GUI when the simulation runs in a
+    server process. Commands are sent over a pipe (except those of the GUI
+    controller, which run locally), and the status and rendered windows
+    shown by the GUI are read from the latest frame the server published
+    in shared memory.
+    """
+    def __init__(self, controller):
+        self.controller = controller
+        self.controller.set_feedback(self.output_feedback)
+        # Spawned rather than forked, since the GUI process already runs threads
+        context = multiprocessing.get_context('spawn')
+        self.connection, server_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_server, args=(server_connection,), name='simulation', daemon=True)
+        self.process.start()
+        self.frames = None
+        self.seq = 0
+        self.status = {
+            'tick': 0,
+            'auto_simrate': 0,
+            'feedback_str': '',
+            'is_animating': False,
+            'windows': {},
+        }
+        # Window name: (size, universe versions the content depends on)
+        self.windows = {}
+        self.sent_windows = None
+        # Request ID: future of batch results
+        self.batches = {}
+        self.batch_ids = itertools.count()
+
+    @property
+    def tick(self):
+        return self.status['tick']
+
+    @property
+    def auto_simrate(self):
+        return self.status['auto_simrate']
+
+    @property
+    def feedback_str(self):
+        return self.status['feedback_str']
+
+    @property
+    def is_animating(self):
+        return self.status['is_animating']
+
+    def gui_prepared(self):
+        pass
+
+    def close(self):
+        if self.process.is_alive():
+            self.connection.send(('quit',))
+            self.process.join(timeout=5)
+        if self.frames is not None:
+            self.frames.close()
+        self.fail_batches(RuntimeError('Simulation server closed'))
+
+    def fail_batches(self, exception):
+        """Set the exception on the futures of batches still waiting for results."""
+        for future in self.batches.values():
+            if not future.done():
+                future.set_exception(exception)
+        self.batches.clear()
+
+    def update(self):
+        frames_name = None
+        try:
+            while self.connection.poll():
+                kind, *args = self.connection.recv()
+                if kind == 'frames':
+                    frames_name = args[0]
+                elif kind == 'batch':
+                    request_id, results = args
+                    # Missing if it timed out and the batches have been failed since
+                    future = self.batches.pop(request_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(results)
+        except EOFError:
+            # The server closed its end of the pipe
+            self.process.join(timeout=1)
+        if frames_name is not None:
+            self.attach_frames(frames_name)
+        if not self.process.is_alive():
+            exception = RuntimeError(f'Simulation server stopped (exit code {self.process.exitcode})')
+            self.fail_batches(exception)
+            raise exception
+        if self.windows != self.sent_windows:
+            self.connection.send(('windows', dict(self.windows)))
+            self.sent_windows = dict(self.windows)
+        if self.frames is None:
+            return
+        frame = self.frames.read(last_seq=self.seq)
+        if frame is not None:
+            self.seq, payload = frame
+            self.status = pickle.loads(payload)
+
+    def attach_frames(self, name):
+        if self.frames is not None:
+            self.frames.close()
+            self.frames = None
+        try:
+            self.frames = SharedFrames.attach(name)
+        except FileNotFoundError:
+            # Already replaced by a larger region, its name is on the way
+            logger.debug('Shared frames {} no longer exist', name)
+
+    def handle_input(self, input_text):
+        if PROMPT_LINE_SPLIT in input_text:
+            lines = input_text.split(PROMPT_LINE_SPLIT)
+        elif PROMPT_LINE_SPLIT_ESCAPE in input_text:
+            lines = input_text.split(PROMPT_LINE_SPLIT_ESCAPE)
+        else:
+            lines = [input_text]
+        for line in lines:
+            if line in CONFIG_DATA['CUSTOM_COMMANDS']:
+                self.handle_input(CONFIG_DATA['CUSTOM_COMMANDS'][line])
+                continue
+            command = line.split(' ', 1)[0]
+            if self.controller.has(command):
+                arg_string = line[len(command)+1:]
+                self.controller.do_command(command, arg_string)
+            else:
+                self.connection.send(('input', line))
+
+    def run_batch(self, batch):
+        """
+        Send a batch of commands to the server, see Universe.run_batch.
+        Returns a future of the results, set when they arrive on update.
+        """
+        request_id = next(self.batch_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.batches[request_id] = future
+        try:
+            self.connection.send(('batch', request_id, batch))
+        except OSError:
+            self.fail_batches(RuntimeError('Simulation server stopped'))
+        return future
+
+    def output_feedback(self, message):
+        self.connection.send(('feedback', message))
+
+    def get_versions(self, names):
+        return tuple(self.get_version(name) for name in names)
+
+    def get_version(self, name):
+        if name == 'log':
+            return LOG_TAIL.version
+        return self.seq
+
+    def get_window_content(self, name, size):
+        if name in LOCAL_WINDOWS:
+            return '\n'.join(LOG_TAIL.tail(size[1]))
+        depends = WINDOW_REFRESH.get(name, DEFAULT_WINDOW_REFRESH)[0]
+        self.windows[name] = size, depends
+        content = self.status['windows'].get(name)
+        if content is None:
+            return 'Waiting for the simulation server...'
+        return content
@@ -0,0 +1,79 @@
+from loguru import logger
+import asyncio
+import time
+
+from util.logs import LOG_SAMPLER
+
+
+class FrameScheduler:
+    """
+    Runs a callback at a target rate, measuring the work of each frame and
+    sleeping only for what remains of its budget.
+
+    When over budget, frames that can be dropped (rendering) skip ahead to
+    the next frame on schedule, while frames that cannot (logic) are run
+    back to back until caught up. While is_idle returns True, the
+    scheduler waits for a wake up, with the idle rate as a heartbeat.
+    """
+    MAXIMUM_BACKLOG = 10
+
+    def __init__(self, name, callback, fps, idle_fps=None, is_idle=None, drop_frames=True):
+        assert callable(callback)
+        assert fps > 0
+        self.name = name
+        self.callback = callback
+        self.fps = fps
+        self.idle_fps = fps if idle_fps is None else idle_fps
+        self.is_idle = is_idle
+        self.drop_frames = drop_frames
+        self.frame_count = 0
+        self.dropped_count = 0
+        self.work_time = 0
+        self.wake_event = None
+
+    @property
+    def idle(self):
+        return self.is_idle is not None and self.is_idle()
+
+    @property
+    def frame_time(self):
+        return 1 / self.fps
+
+    def wake(self):
+        """Run the next frame without waiting for the heartbeat when idle. Not thread safe."""
+        if self.wake_event is not None:
+            self.wake_event.set()
+
+    async def wait_idle(self):
+        try:
+            await asyncio.wait_for(self.wake_event.wait(), timeout=1 / self.idle_fps)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        self.wake_event = asyncio.Event()
+        next_frame = time.perf_counter()
+        while True:
+            if self.idle:
+                await self.wait_idle()
+                next_frame = time.perf_counter()
+            self.wake_event.clear()
+            start = time.perf_counter()
+            self.callback()
+            end = time.perf_counter()
+            self.work_time = end - start
+            self.frame_count += 1
+            next_frame += self.frame_time
+            behind = end - next_frame
+            if behind > 0:
+                missed = int(behind // self.frame_time) + 1
+                if self.drop_frames or missed > self.MAXIMUM_BACKLOG:
+                    # Skip the missed frames and start again on schedule
+                    self.dropped_count += missed
+                    next_frame += missed * self.frame_time
+                    if LOG_SAMPLER(f'{self.name} dropped'):
+                        logger.opt(lazy=True).debug('{} dropped {} frames ({} total), work took {:.1f} ms',
+                            lambda: self.name, lambda: missed, lambda: self.dropped_count,
+                            lambda: self.work_time * 1000)
+            # Always yield to the event loop, even when catching up
+            await asyncio.sleep(max(0, next_frame - time.perf_counter()))
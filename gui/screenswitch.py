@@ -1,14 +1,20 @@
 from loguru import logger
+import time
 from prompt_toolkit.layout import Dimension
 from prompt_toolkit.layout.containers import Window, VSplit, HSplit, ConditionalContainer
 from prompt_toolkit.layout.controls import FormattedTextControl
-from prompt_toolkit.formatted_text import HTML
+from prompt_toolkit.formatted_text import FormattedText
 from prompt_toolkit.widgets import Frame
 from prompt_toolkit.filters import Condition
 
-from util import escape_if_malformed
+from util import parse_markup
 from util.argparse import arg_validation
 from util.layout import WSubLayout, VSubLayout
+from gui.layout import FPS, WINDOW_REFRESH, DEFAULT_WINDOW_REFRESH
+
+
+# Render frames arriving this early still refresh a window, as frames are scheduled with some jitter
+REFRESH_TOLERANCE = 0.5 / FPS
 
 
 class ScreenSwitcher(VSplit):
@@ -68,6 +74,9 @@ class Screen(VSplit):
         self.app = app
         self.name = name
         root_container, self.text_controls = self.get_sublayout(sublayout)
+        self.window_states = {}
+        # Window name: (markup, formatted text) of the last content
+        self.window_markup = {}
         if len(self.text_controls) == 0:
             m = f'Screen {name} built without any text controls'
             logger.error(m)
@@ -75,13 +84,32 @@ class Screen(VSplit):
         super().__init__([root_container])
 
     def update(self):
+        now = time.perf_counter()
         for name, tc in self.text_controls.items():
             size = tc.last_size
+            depends, max_fps = WINDOW_REFRESH.get(name, DEFAULT_WINDOW_REFRESH)
+            last_state, next_time = self.window_states.get(name, (None, None))
+            if next_time is not None and now < next_time:
+                continue
+            # Skip windows whose size and dependencies have not changed
+            state = size, None if depends is None else self.app.get_versions(depends)
+            if depends is not None and state == last_state:
+                continue
+            self.window_states[name] = state, now + 1 / max_fps - REFRESH_TOLERANCE
             r = self.app.get_window_content(name, size)
             if r is None:
                 continue
-            h = HTML(escape_if_malformed(r))
-            tc.text = h
+            if not isinstance(r, FormattedText):
+                r = self.parse_content(name, str(r))
+            tc.text = r
+
+    def parse_content(self, name, markup):
+        # Most content changes with every refresh, only unchanged content is reused
+        last_markup, text = self.window_markup.get(name, (None, None))
+        if markup != last_markup:
+            text = parse_markup(markup, cache=False)
+            self.window_markup[name] = markup, text
+        return text
 
     @classmethod
     def get_sublayout(cls, sublayout):
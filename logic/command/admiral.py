@@ -6,7 +6,6 @@ import numpy as np
 from util import OBJECT_COLORS, CELESTIAL_NAMES
 from util.argparse import arg_validation
 from logic.dso.ship import Ship, Tug, Fighter, Escort, Port
-from logic.dso.celestial import CelestialObject
 
 
 PREFIXES = ['XSS', 'KRS', 'ISS', 'JTS', 'VSS']
@@ -125,10 +124,7 @@ class Agent(Admiral):
         self.universe.add_event(0, None, self.first_order, 'Start first order')
 
     def get_new_destination(self):
-        oid = random.randint(0, self.universe.object_count-1)
-        while not isinstance(self.universe.ds_objects[oid], CelestialObject):
-            oid = random.randint(0, self.universe.object_count-1)
-        return oid
+        return random.choice(np.flatnonzero(self.universe.ds_celestials))
 
     def first_order(self, uid):
         oids = random.choices(np.flatnonzero(self.universe.ds_celestials), k=5)
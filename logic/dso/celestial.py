@@ -3,20 +3,23 @@ from logic.dso.dso import DeepSpaceObject
 
 
 class CelestialObject(DeepSpaceObject):
-    pass
+    __slots__ = ()
 
 
 class SMBH(CelestialObject):
+    __slots__ = ()
     type_name = 'SMBH'
     icon = '■'
     color = 'grey'
 
 class Star(CelestialObject):
+    __slots__ = ()
     type_name = 'star'
     icon = '¤'
     color = 'white'
 
 class Rock(CelestialObject):
+    __slots__ = ()
     type_name = 'rock'
     icon = '•'
     color = 'brown'
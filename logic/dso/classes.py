@@ -0,0 +1,34 @@
+from loguru import logger
+import numpy as np
+
+from logic.dso.dso import DeepSpaceObject
+from logic.dso.celestial import CelestialObject, SMBH, Star, Rock
+from logic.dso.ship import Ship, Tug, Fighter, Escort, Port
+
+
+TYPE_NAMES = ('object', 'celestial', 'ship')
+TYPE_OBJECT, TYPE_CELESTIAL, TYPE_SHIP = range(len(TYPE_NAMES))
+NO_FID = -1
+NO_PARENT = -1
+
+DSO_CLASSES = (
+    DeepSpaceObject,
+    CelestialObject, SMBH, Star, Rock,
+    Ship, Tug, Fighter, Escort, Port,
+)
+CLASS_IDS = {cls: i for i, cls in enumerate(DSO_CLASSES)}
+
+
+def get_type_id(cls):
+    if issubclass(cls, Ship):
+        return TYPE_SHIP
+    if issubclass(cls, CelestialObject):
+        return TYPE_CELESTIAL
+    return TYPE_OBJECT
+
+
+# Lookup tables indexed by class ID
+CLASS_TYPES = np.asarray([get_type_id(cls) for cls in DSO_CLASSES], dtype=np.int8)
+CLASS_NAMES = np.asarray([cls.type_name for cls in DSO_CLASSES])
+CLASS_ICONS = np.asarray([cls.icon for cls in DSO_CLASSES])
+CLASS_COLORS = np.asarray([cls.color for cls in DSO_CLASSES])
@@ -1,23 +1,47 @@
 from loguru import logger
 import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 from util.config import CONFIG_DATA
-from util import OBJECT_COLORS, CELESTIAL_NAMES
+from util import OBJECT_COLORS, CELESTIAL_NAMES, RADIANS_IN_DEGREES, is_index, escape_html
 from util.argparse import arg_validation
 from util.camera import Camera
 from util.charmap import CharMap
+from util.spatial import GridIndex
 
 
+# Immutable copy of the universe state needed to draw the map
+RenderSnapshot = namedtuple('RenderSnapshot', [
+    'size', 'positions', 'icons', 'tags', 'priorities', 'celestials', 'hierarchy', 'velocity',
+])
+# Celestial objects projected once for as long as camera translation barely moves them
+FarLayer = namedtuple('FarLayer', ['key', 'pos', 'min_dist', 'eligible', 'mask', 'projected'])
+# Drawn map and the caches to keep for the next one, applied on the thread that owns the cockpit
+RenderResult = namedtuple('RenderResult', ['content', 'charmap', 'far_layer', 'spatial_index'])
+
 
 class Cockpit:
     def __init__(self, ship):
         self.ship = ship
         self.camera = Camera()
         self.show_labels = CONFIG_DATA['SHOW_LABELS']
+        self.show_density = CONFIG_DATA['SHOW_DENSITY']
         self.camera_following = None
         self.camera_tracking = None
-        self._last_charmap_state = bytes(1)
+        self._last_charmap_state = None
+        # Object count the index was built for, and the index
+        self._spatial_index = 0, None
+        self._far_layer = None
+        self.last_charmap = None
+        self.selected = None
+        # The map is drawn from a snapshot, in a worker thread if configured
+        self.render_camera = Camera()
+        self.render_version = 0
+        self._render_executor = None
+        self._render_future = None
+        self._snapshot_buffers = [np.empty((0, 3)), np.empty((0, 3))]
 
     @property
     def commands(self):
@@ -26,9 +50,11 @@ class Cockpit:
             ('track', self.track),
             ('look', self.look),
             ('snaplook', self.snaplook),
+            ('pick', self.pick),
             ('pro', self.look_prograde),
             ('retro', self.look_retrograde),
             ('labels', self.toggle_labels),
+            ('density', self.toggle_density),
         ]
         return cockpit_commands + self.camera.commands
 
@@ -64,14 +90,16 @@ class Cockpit:
             return self.universe.positions[oid]
         self.camera.track(partial(get_pos, oid) if oid is not None else None)
 
-    def look(self, oid, ms=None, smooth=None):
+    def look(self, oid=None, ms=None, smooth=None):
         """ArgSpec
         Turn to look at a deep space object
         ___
-        OID Object ID
+        +OID Object ID (default: picked object)
         +MS How long to swivel for in ms
         -+s SMOOTH How smoothly to swivel between -1 and 1
         """
+        if oid is None:
+            oid = self.selected
         if ms is None:
             ms = CONFIG_DATA['CAMERA_SMOOTH_TIME']
         if smooth is None:
@@ -85,17 +113,50 @@ class Cockpit:
 
         self.camera.swivel_to_point(self.universe.ds_objects[oid].position, ms, smooth)
 
-    def snaplook(self, oid):
+    def snaplook(self, oid=None):
         """ArgSpec
         Instantly turn to look at a deep space object
         ___
-        OID Object ID
+        +OID Object ID (default: picked object)
         """
+        if oid is None:
+            oid = self.selected
         with arg_validation(f'Invalid object ID: {oid}'):
             assert self.universe.is_oid(oid)
 
         self.camera.look_at_point(self.universe.positions[oid])
 
+    def pick(self, x=None, y=None):
+        """ArgSpec
+        Pick the object nearest to the crosshair or a map cell
+        ___
+        +X Map column
+        +Y Map row
+        """
+        charmap = self.last_charmap
+        with arg_validation('Map has not been drawn yet'):
+            assert charmap is not None
+        if x is None and y is None:
+            x, y = charmap.center
+        with arg_validation(f'Map cell must be within {charmap.width}×{charmap.height}: {x}, {y}'):
+            assert is_index(x) and is_index(y)
+            assert x < charmap.width and y < charmap.height
+
+        oid = charmap.pick(x, y, radius=CONFIG_DATA['PICK_RADIUS'])
+        if oid is None:
+            self.universe.output_feedback(f'<red>No object near</red> <code>{x}, {y}</code>')
+            return
+        self.selected = oid
+        ob = self.universe.ds_objects[oid]
+        self.universe.output_feedback(f'Picked: <{ob.color}>{escape_html(ob.label)}</{ob.color}>')
+
+    def get_hover_oid(self):
+        """Object nearest to the crosshair on the last drawn map."""
+        if self.last_charmap is None:
+            return None
+        x, y = self.last_charmap.center
+        return self.last_charmap.pick(x, y, radius=CONFIG_DATA['PICK_RADIUS'])
+
     def look_prograde(self):
         """Turn to look at prograde vector"""
         self.camera.look_at_point(self.ship.velocity * 10 **10)
@@ -108,48 +169,195 @@ class Cockpit:
         """Toggle labels"""
         self.show_labels = (self.show_labels + 1) % 4
 
+    def toggle_density(self):
+        """Toggle showing the number of objects in crowded cells"""
+        self.show_density = not self.show_density
+
     # Display
     def draw_charmap(self, size):
+        result = self.render_charmap(self.get_render_snapshot(size))
+        self.apply_render_result(result)
+        return result.content
+
+    def apply_render_result(self, result):
+        if result.charmap is not None:
+            self.last_charmap = result.charmap
+        self._far_layer = result.far_layer
+        self._spatial_index = result.spatial_index
+        # Windows showing what is under the crosshair depend on the applied map
+        self.render_version += 1
+
+    def get_render_snapshot(self, size):
+        """
+        Copy the state needed to draw the map, such that it can be drawn
+        while the universe and camera change. Positions alternate between
+        two buffers, the one being drawn from is never overwritten.
+        """
+        self._snapshot_buffers.reverse()
+        positions = self.universe.positions
+        if self._snapshot_buffers[0].shape != positions.shape:
+            self._snapshot_buffers[0] = np.empty_like(positions)
+        np.copyto(self._snapshot_buffers[0], positions)
+        self.camera.update()
+        self.render_camera.copy_state(self.camera)
+        return RenderSnapshot(
+            size=size,
+            positions=self._snapshot_buffers[0],
+            icons=self.universe.object_icons,
+            tags=self.universe.object_colors,
+            priorities=self.universe.type_ids,
+            celestials=self.universe.ds_celestials,
+            hierarchy=self.universe.hierarchy,
+            velocity=np.copy(self.ship.velocity),
+        )
+
+    def render_charmap(self, snapshot):
+        """
+        Draw the map from a snapshot. Only reads the cockpit caches, the
+        new ones are returned with the map (see apply_render_result).
+        """
+        size = snapshot.size
         if size[0] < CharMap.MINIMUM_SIZE or size[1] < CharMap.MINIMUM_SIZE:
-            return 'Window too small'
-        charmap = CharMap(self.camera, size)
-        points = self.universe.positions
+            return RenderResult('Window too small', None, self._far_layer, self._spatial_index)
+        charmap = CharMap(self.render_camera, size, show_density=self.show_density)
+        spatial_index = self.get_spatial_index(snapshot)
+        index = spatial_index[1]
+        # Distant objects are projected from a cache, only nearby objects are projected every frame
+        lod_mask = self.get_lod_mask(snapshot)
+        far_layer = self.get_far_layer(charmap, snapshot, lod_mask, index)
+        far_pix, far_dists = far_layer.projected
+        near_pix, near_dists = self.get_near_pixels(charmap, snapshot, lod_mask & ~far_layer.mask, index)
         label_getter = self.get_label if self.show_labels else None
-        charmap.add_objects(
-            points=points,
-            icon=self.get_icon,
-            tag=self.get_tag,
+        charmap.add_pixels(
+            pix_pos=np.concatenate((far_pix, near_pix)),
+            icons=snapshot.icons,
+            tags=snapshot.tags,
             label=label_getter,
+            priorities=snapshot.priorities,
+            distances=np.concatenate((far_dists, near_dists)),
         )
         charmap.add_projection_axes()
         charmap.add_crosshair()
         charmap.add_prograde_retrograde(
-            velocity=self.ship.velocity,
+            velocity=snapshot.velocity,
             show_labels=self.show_labels,
             show_speed=self.show_labels > 1,
         )
-        return charmap.draw()
+        return RenderResult(charmap.draw(), charmap, far_layer, spatial_index)
+
+    def get_lod_mask(self, snapshot):
+        """Mask of objects to draw, with star systems too small on the map collapsed to their star."""
+        camera = self.render_camera
+        mask = ~snapshot.celestials
+        visible = snapshot.hierarchy.get_visible(
+            camera_pos=camera.pos,
+            pixels_per_radian=RADIANS_IN_DEGREES * camera.zoom,
+            minimum_pixels=CONFIG_DATA['LOD_PIXELS'],
+        )
+        mask[visible] = True
+        return mask
+
+    def get_far_layer(self, charmap, snapshot, lod_mask, index):
+        """
+        The far layer and its projected pixels: celestial objects far enough
+        that camera translation barely moves them on the map. These are
+        reprojected only when the camera rotates or zooms, the map is
+        resized, objects are added, the level of detail of any of them
+        changes, or the camera has moved enough for the nearest of them to
+        shift by more than the parallax threshold.
+        """
+        camera = self.render_camera
+        key = camera.rotation_version, camera.zoom_version, charmap.size, len(snapshot.positions)
+        far_layer = self._far_layer
+        if far_layer is not None and far_layer.key == key:
+            moved = np.linalg.norm(camera.pos - far_layer.pos)
+            scale = RADIANS_IN_DEGREES * camera.zoom * max(1, CONFIG_DATA['ASPECT_RATIO'])
+            parallax = moved / far_layer.min_dist * scale
+            # Star systems of the layer may have collapsed or expanded since
+            if parallax < CONFIG_DATA['FAR_LAYER_PARALLAX'] and np.array_equal(
+                    far_layer.eligible & lod_mask, far_layer.mask):
+                return far_layer
+        dists = np.linalg.norm(snapshot.positions - camera.pos, axis=-1)
+        eligible = snapshot.celestials & (dists >= CONFIG_DATA['FAR_LAYER_DISTANCE'])
+        far_mask = eligible & lod_mask
+        candidates = self.get_candidates(charmap, snapshot, far_mask, index)
+        projected = charmap.get_projected_pixels(
+            snapshot.positions, candidates, dtype=charmap.dtype, return_distances=True)
+        min_dist = dists[far_mask].min() if far_mask.any() else np.inf
+        return FarLayer(key, np.copy(camera.pos), min_dist, eligible, far_mask, projected)
+
+    def get_near_pixels(self, charmap, snapshot, near_mask, index):
+        candidates = self.get_candidates(charmap, snapshot, near_mask, index)
+        return charmap.get_projected_pixels(
+            snapshot.positions, candidates, dtype=charmap.dtype, return_distances=True)
+
+    def get_candidates(self, charmap, snapshot, mask, index):
+        """Objects of the mask that may be in view, skipping static objects in grid cells outside the frustum."""
+        if index is None:
+            return np.flatnonzero(mask)
+        visible = index.query(charmap.get_visible_cells(index))
+        visible = visible[mask[visible]]
+        dynamic = np.flatnonzero(mask & ~snapshot.celestials)
+        return np.concatenate((visible, dynamic))
+
+    def get_spatial_index(self, snapshot):
+        """The object count and spatial index of celestial objects (None if too few)."""
+        # Celestial objects do not move, their index is rebuilt only when objects are added
+        object_count = len(snapshot.positions)
+        if self._spatial_index[0] == object_count:
+            return self._spatial_index
+        celestials = np.flatnonzero(snapshot.celestials)
+        index = None
+        if len(celestials) >= CONFIG_DATA['SPATIAL_INDEX_MINIMUM']:
+            index = GridIndex(
+                points=snapshot.positions[celestials],
+                indices=celestials,
+                cell_size=CONFIG_DATA['SPATIAL_INDEX_CELL_SIZE'],
+            )
+        return object_count, index
 
     def get_charmap(self, size):
-        state = ''.join([
-            str(self.universe.tick),
-            str(size),
-            str(self.show_labels),
-            str(self.camera.state),
-        ])
-        current_state = bytes(state, encoding='utf-8')
-        if self._last_charmap_state == current_state:
-            return None
-        self._last_charmap_state = current_state
-        return self.draw_charmap(size=size)
+        state = (
+            self.universe.tick,
+            size,
+            self.show_labels,
+            self.show_density,
+            self.camera.state,
+        )
+        if not CONFIG_DATA['RENDER_THREAD']:
+            if self._last_charmap_state == state:
+                return None
+            self._last_charmap_state = state
+            return self.draw_charmap(size=size)
+        return self.get_threaded_charmap(size, state)
 
-    def get_icon(self, oid):
-        return self.universe.ds_objects[oid].icon
+    def get_threaded_charmap(self, size, state):
+        """
+        The most recently completed map drawn in the worker thread, or None
+        if there is no new one. A new map is started from a snapshot when
+        the state has changed and the worker is free.
+        """
+        completed = None
+        if self._render_future is not None and self._render_future.done():
+            result = self._render_future.result()
+            self._render_future = None
+            self.apply_render_result(result)
+            completed = result.content
+        if self._render_future is None and self._last_charmap_state != state:
+            self._last_charmap_state = state
+            if self._render_executor is None:
+                self._render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='render')
+            snapshot = self.get_render_snapshot(size)
+            self._render_future = self._render_executor.submit(self._render_in_thread, snapshot)
+        return completed
 
-    def get_tag(self, oid):
-        return self.universe.ds_objects[oid].color
+    def _render_in_thread(self, snapshot):
+        result = self.render_charmap(snapshot)
+        # Signals the completion to the owning thread, which applies the result
+        self.render_version += 1
+        return result
 
-    def get_label(self, oid):
+    def get_label(self, oid, dist=None):
         ob = self.universe.ds_objects[oid]
         lbl = ''
         if self.show_labels == 1:
@@ -157,6 +365,7 @@ class Cockpit:
         elif self.show_labels >= 2:
             lbl = f'{ob.oid}.{ob.name}'
         if self.show_labels == 3:
-            dist = np.linalg.norm(self.camera.pos - ob.position)
+            if dist is None:
+                dist = np.linalg.norm(self.camera.pos - ob.position)
             lbl = f'{lbl} ({dist:.3e})'
         return lbl
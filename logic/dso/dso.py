@@ -3,6 +3,8 @@ import numpy as np
 
 
 class DeepSpaceObject:
+    """A thin view of a deep space object, whose data is stored in the universe."""
+    __slots__ = ('universe', 'oid')
     type_name = 'Object'
     icon = '?'
     color = 'grey'
@@ -13,7 +15,18 @@ class DeepSpaceObject:
 
     def setup(self, name):
         self.name = name
-        self.label = f'{self.icon}{self.oid} {self.name}'
+
+    @property
+    def name(self):
+        return self.universe.ds_names[self.oid]
+
+    @name.setter
+    def name(self, name):
+        self.universe.ds_names[self.oid] = name
+
+    @property
+    def label(self):
+        return f'{self.icon}{self.oid} {self.name}'
 
     @property
     def position(self):
@@ -33,3 +46,4 @@ class DeepSpaceObject:
     def offset_from_parent(self, parent, offset):
         offset_coords = np.random.normal(0, offset, size=3)
         self.position[:] = parent.position + offset_coords
+        self.universe.parents[self.oid] = parent.oid
@@ -3,7 +3,6 @@ import math
 import random
 import numpy as np
 import itertools
-from collections import defaultdict
 
 from util import EPSILON
 from util.argparse import arg_validation
@@ -13,26 +12,47 @@ from logic.dso.dso import DeepSpaceObject
 
 
 class Ship(DeepSpaceObject):
+    __slots__ = ('current_order_uid', 'navigation', 'patrol_look', 'patrol_cycle', '_cockpit')
     type_name = 'ship'
     thrust = 1
     icon = '·'
     color = 'green'
-    current_order_uid = None
-    navigation = None
-    patrol_look = False
+
+    def __init__(self, universe, oid):
+        super().__init__(universe, oid)
+        self.current_order_uid = None
+        self.navigation = None
+        self.patrol_look = False
+        self.patrol_cycle = None
+        self._cockpit = None
 
     def setup(self, fid, name, parent=None):
-        self.fid = fid
+        assert self.fid == fid
         self.name = name
-        self.my_admiral = self.universe.admirals[fid]
         if parent is None:
             parent_oid = random.choice(np.flatnonzero(self.universe.ds_celestials))
             parent = self.universe.ds_objects[parent_oid]
         self.offset_from_parent(parent, 10**2)
-        self.label = f'{self.icon}{self.oid} {self.name}'
-        self.cockpit = Cockpit(ship=self)
-        self.cockpit.follow(self.oid)
-        self.stats = defaultdict(lambda: 0)
+
+    @property
+    def fid(self):
+        return self.universe.fids[self.oid]
+
+    @property
+    def my_admiral(self):
+        return self.universe.admirals[self.fid]
+
+    @property
+    def cockpit(self):
+        # Cockpits are only created when first used, usually only for the player
+        if self._cockpit is None:
+            self._cockpit = Cockpit(ship=self)
+            self._cockpit.follow(self.oid)
+        return self._cockpit
+
+    @property
+    def has_cockpit(self):
+        return self._cockpit is not None
 
     @property
     def commands(self):
@@ -68,7 +88,7 @@ class Ship(DeepSpaceObject):
 
     def _do_order_patrol(self, oids):
         if self.thrust == 0:
-            logger.debug(f'{self} ignoring order_patrol since we have no thrust')
+            logger.debug('{} ignoring order_patrol since we have no thrust', self)
             return
         self.current_order_uid = uid = random.random()
         self.patrol_cycle = itertools.cycle(oids)
@@ -77,7 +97,7 @@ class Ship(DeepSpaceObject):
 
     def _next_patrol(self, uid):
         if 0 != uid != self.current_order_uid:
-            logger.debug(f'next_patrol with obsolete uid: {uid} {f}')
+            logger.debug('next_patrol with obsolete uid: {}', uid)
             return
         oid = next(self.patrol_cycle)
         self.fly_to(oid, self.patrol_look, uid)
@@ -97,7 +117,7 @@ class Ship(DeepSpaceObject):
         with arg_validation(f'Invalid object ID: {oid}'):
             assert self.universe.is_oid(oid)
         if self.thrust == 0:
-            logger.debug(f'{self} ignoring fly_to since we have no thrust')
+            logger.debug('{} ignoring fly_to since we have no thrust', self)
             return
         # Look at the target
         if look:
@@ -118,10 +138,10 @@ class Ship(DeepSpaceObject):
 
     def _do_next_navstage(self, uid):
         if self.navigation is None:
-            logger.debug(f'do_next_navstage with obsolete uid: {uid} (no navigation configured)')
+            logger.debug('do_next_navstage with obsolete uid: {} (no navigation configured)', uid)
             return
         if 0 != uid != self.navigation.uid:
-            logger.debug(f'do_next_navstage with obsolete uid: {uid} != {self.navigation.uid}')
+            logger.debug('do_next_navstage with obsolete uid: {} != {}', uid, self.navigation.uid)
             return
         # Do next stage
         assert not self.navigation.is_last_stage
@@ -142,7 +162,12 @@ class Ship(DeepSpaceObject):
         mag = np.linalg.norm(vector)
         if mag > self.thrust:
             vector *= self.thrust / mag
+        self._set_acceleration(vector)
+
+    def _set_acceleration(self, vector):
         self.universe.engine.get_derivative_second('position')[self.oid] = vector
+        # Proximity events predicted with the previous acceleration are obsolete
+        self.universe.proximity.rescan(self.oid)
 
     # Engine
     def engine_burn(self, vector=None, throttle=1):
@@ -153,7 +178,7 @@ class Ship(DeepSpaceObject):
         """
         if vector is None:
             self.cockpit.camera.update()
-            vector = self.cockpit.camera.current_axes[0]
+            vector = np.copy(self.cockpit.camera.current_axes[0])
         with arg_validation(f'Throttle must be a positive number between 0 and 1: {throttle}'):
             assert 0 < throttle <= 1
         with arg_validation(f'Invalid vector: {vector}'):
@@ -166,11 +191,11 @@ class Ship(DeepSpaceObject):
             logger.warning(m)
             return
         vector *= self.thrust * throttle / mag
-        self.universe.engine.get_derivative_second('position')[self.oid] = vector
+        self._set_acceleration(vector)
 
     def engine_cut_burn(self):
         """Cut the engine"""
-        self.universe.engine.get_derivative_second('position')[self.oid] = 0
+        self._set_acceleration(0)
 
     def engine_break_burn(self, throttle=1, auto_cutoff=False):
         """ArgSpec
@@ -213,6 +238,7 @@ class Ship(DeepSpaceObject):
 
 
 class Tug(Ship):
+    __slots__ = ()
     type_name = 'tug'
     thrust = 0.01
     icon = '¬'
@@ -220,6 +246,7 @@ class Tug(Ship):
 
 
 class Fighter(Ship):
+    __slots__ = ()
     type_name = 'fighter'
     thrust = 3
     icon = '‡'
@@ -227,6 +254,7 @@ class Fighter(Ship):
 
 
 class Escort(Ship):
+    __slots__ = ()
     type_name = 'escort'
     thrust = 1
     icon = '≡'
@@ -234,6 +262,7 @@ class Escort(Ship):
 
 
 class Port(Ship):
+    __slots__ = ()
     type_name = 'port'
     thrust = 0
     icon = 'þ'
@@ -1,31 +1,54 @@
 from loguru import logger
 import numpy as np
 
+
+MINIMUM_CAPACITY = 64
+
+
 class Engine:
-    def __init__(self, stats: dict[str, int]):
+    def __init__(self, stats: dict[str, int], columns: dict[str, tuple] = None):
         self.stats = {}
+        self.columns = {}
+        self.column_defaults = {}
         self.object_count = 0
+        self.__capacity = 0
         for stat_name, vector_size in stats.items():
             self.__add_stat(stat_name, vector_size)
+        if columns is not None:
+            for column_name, (dtype, default) in columns.items():
+                self.__add_column(column_name, dtype, default)
 
     def get_stat(self, stat_name, index=slice(None)):
-        return self.stats[stat_name][0, index, :]
+        return self.stats[stat_name][0, :self.object_count][index]
 
     def get_derivative(self, stat_name, index=slice(None)):
-        return self.stats[stat_name][1, index, :]
+        return self.stats[stat_name][1, :self.object_count][index]
 
     def get_derivative_second(self, stat_name, index=slice(None)):
-        return self.stats[stat_name][2, index, :]
+        return self.stats[stat_name][2, :self.object_count][index]
+
+    def get_column(self, column_name, index=slice(None)):
+        return self.columns[column_name][:self.object_count][index]
+
+    @property
+    def capacity(self):
+        return self.__capacity
 
     def __add_stat(self, stat_name: str, size: int, dtype=np.float64):
         assert stat_name not in self.stats
-        self.stats[stat_name] = np.zeros((3, self.object_count, size), dtype=dtype)
+        self.stats[stat_name] = np.zeros((3, self.capacity, size), dtype=dtype)
+
+    def __add_column(self, column_name: str, dtype, default=0):
+        assert column_name not in self.columns
+        self.columns[column_name] = np.full(self.capacity, default, dtype=dtype)
+        self.column_defaults[column_name] = default
 
     def tick(self, ticks):
         self.__apply_derivatives(ticks)
 
     def __apply_derivatives(self, ticks):
         for stat_table in self.stats.values():
+            stat_table = stat_table[:, :self.object_count]
             # Adjust position - add velocity over time
             # Integration: c2 += c0 * t**2 / 2 + t * c1
             stat_table[0] += stat_table[2] * (ticks ** 2) / 2 + (ticks * stat_table[1])
@@ -33,13 +56,21 @@ class Engine:
             stat_table[1] += stat_table[2] * ticks
 
     def add_objects(self, count=1):
-        new_stats = {}
         self.object_count += count
+        if self.object_count > self.capacity:
+            # Grow geometrically such that adding objects one at a time is amortized
+            self.__grow(max(self.object_count, self.capacity * 2, MINIMUM_CAPACITY))
+
+    def __grow(self, capacity):
+        old_capacity = self.capacity
+        self.__capacity = capacity
         for stat_name, stat_table in self.stats.items():
             new_shape = list(stat_table.shape)
-            new_shape[1] = 1
-            new_entry = np.zeros(new_shape, dtype=stat_table.dtype)
-            new_table = np.concatenate((stat_table, new_entry), dtype=stat_table.dtype, axis=1)
-            assert new_table.shape[1] == self.object_count
-            new_stats[stat_name] = new_table
-        self.stats = new_stats
+            new_shape[1] = capacity
+            new_table = np.zeros(new_shape, dtype=stat_table.dtype)
+            new_table[:, :old_capacity] = stat_table
+            self.stats[stat_name] = new_table
+        for column_name, column in self.columns.items():
+            new_column = np.full(capacity, self.column_defaults[column_name], dtype=column.dtype)
+            new_column[:old_capacity] = column
+            self.columns[column_name] = new_column
@@ -0,0 +1,68 @@
+from loguru import logger
+import numpy as np
+
+from logic.dso.classes import NO_PARENT
+
+
+class Hierarchy:
+    """
+    Parent and child relations of static objects (e.g. SMBH, stars and
+    rocks), with the children of each object stored as compressed sparse
+    rows and the radius of each subtree around its root.
+    """
+    def __init__(self, parents, positions, mask):
+        self.positions = np.copy(positions)
+        has_parent = parents != NO_PARENT
+        self.roots = np.flatnonzero(mask & ~has_parent)
+        children = np.flatnonzero(mask & has_parent)
+        children = children[np.argsort(parents[children], kind='stable')]
+        self.children = children
+        self.counts = np.bincount(parents[children], minlength=len(parents))
+        self.offsets = np.cumsum(self.counts) - self.counts
+        self.radii = self._get_radii(parents, children)
+
+    def _get_radii(self, parents, children):
+        # Depth of each child, by walking up the parents one level at a time
+        depths = np.zeros(len(parents), dtype=np.int32)
+        ancestors = parents[children]
+        while len(ancestors):
+            depths[children] += 1
+            ancestors_have_parent = parents[ancestors] != NO_PARENT
+            children = children[ancestors_have_parent]
+            ancestors = parents[ancestors[ancestors_have_parent]]
+        # Grow the radius of each parent from the deepest level up
+        radii = np.zeros(len(parents), dtype=np.float64)
+        for depth in range(depths.max(initial=0), 0, -1):
+            level = self.children[depths[self.children] == depth]
+            level_parents = parents[level]
+            offsets = self.positions[level] - self.positions[level_parents]
+            reach = np.linalg.norm(offsets, axis=-1) + radii[level]
+            np.maximum.at(radii, level_parents, reach)
+        return radii
+
+    def get_children(self, oids):
+        """Children of all given objects."""
+        counts = self.counts[oids]
+        starts = self.offsets[oids]
+        # Concatenate the ranges of each object
+        run_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self.children[run_starts + np.arange(counts.sum())]
+
+    def get_visible(self, camera_pos, pixels_per_radian, minimum_pixels):
+        """
+        Objects to draw, expanding systems from the roots down only while
+        their radius in pixels is at least the minimum (or the camera is
+        within them). A collapsed system is drawn as its root alone.
+        """
+        visible = [self.roots]
+        frontier = self.roots
+        while len(frontier):
+            systems = frontier[self.counts[frontier] > 0]
+            radii = self.radii[systems]
+            dists = np.linalg.norm(self.positions[systems] - camera_pos, axis=-1)
+            with np.errstate(divide='ignore'):
+                pixels = radii / dists * pixels_per_radian
+            expand = (dists <= radii) | (pixels >= minimum_pixels)
+            frontier = self.get_children(systems[expand])
+            visible.append(frontier)
+        return np.concatenate(visible)
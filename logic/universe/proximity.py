@@ -0,0 +1,294 @@
+from loguru import logger
+import random
+import numpy as np
+
+from util import EPSILON
+from util.config import CONFIG_DATA
+
+
+ROOT_TOLERANCE = 10**-6
+
+
+class ProximityDetector:
+    """Schedules proximity events (encounters, arrivals, collisions) in the universe event queue.
+
+    Every scan looks ahead a fixed horizon of ticks. The broad phase finds
+    candidate pairs by binary search of the static objects (see
+    StaticIndex) and sweep-and-prune among the others, over the swept
+    bounding boxes of the objects, and the narrow phase solves the constant-acceleration
+    motion of each candidate pair for the exact tick of entering a radius.
+    Objects whose acceleration changes are rescanned until the next scan.
+    """
+    def __init__(self, universe):
+        self.universe = universe
+        self.radii = sorted(CONFIG_DATA['PROXIMITY_RADIUS'].items(), key=lambda kr: kr[1])
+        self.max_radius = self.radii[-1][1]
+        self.horizon = CONFIG_DATA['PROXIMITY_HORIZON']
+        self.next_scan_tick = 0
+        self.static_index = None
+        self.pending = {}
+        # (kind, oid1, oid2) of pairs within radius when last scanned or since entering
+        self.inside = set()
+
+    def setup(self):
+        self.universe.add_event(0, None, self.scan, 'Proximity scan')
+
+    def scan(self, uid):
+        tick = self.universe.tick
+        self.next_scan_tick = tick + self.horizon
+        # Every pending event is predicted again
+        self.pending.clear()
+        self.inside = self.scan_pairs(self.horizon, was_inside=self.inside)
+        self.universe.add_event(0, self.next_scan_tick, self.scan, 'Proximity scan')
+
+    def rescan(self, oid):
+        """Predict again the events of an object until the next scan, when its acceleration changed."""
+        tick = self.universe.tick
+        if self.static_index is not None:
+            self.static_index.set_moved([oid])
+        ticks = self.next_scan_tick - tick
+        if ticks <= 0:
+            return
+        for uid, (event_tick, kind, radius, oid1, oid2) in list(self.pending.items()):
+            if event_tick > tick and oid in (oid1, oid2):
+                del self.pending[uid]
+        self.inside = {key for key in self.inside if oid not in key[1:]}
+        # Positions do not change with the acceleration, pairs within radius already were
+        self.inside |= self.scan_pairs(ticks, np.asarray([oid]))
+
+    def scan_pairs(self, ticks, oids=None, was_inside=None):
+        """
+        Schedule the events of candidate pairs within ticks, returns the
+        pairs found within radius. Pairs within radius now that were not in
+        was_inside have entered since, their event is now.
+        """
+        tick = self.universe.tick
+        engine = self.universe.engine
+        positions = engine.get_stat('position')
+        velocities = engine.get_derivative('position')
+        accelerations = engine.get_derivative_second('position')
+        a, b = self.find_pairs(positions, velocities, accelerations, ticks, oids)
+        inside = set()
+        for oid1, oid2 in zip(np.minimum(a, b), np.maximum(a, b)):
+            dp = positions[oid2] - positions[oid1]
+            dv = velocities[oid2] - velocities[oid1]
+            da = accelerations[oid2] - accelerations[oid1]
+            coefs = distance_polynomial(dp, dv, da)
+            approach_tick, approach_dist = closest_approach(coefs, ticks)
+            for kind, radius in self.radii:
+                if approach_dist > radius:
+                    continue
+                key = kind, oid1, oid2
+                if is_within(coefs, radius):
+                    inside.add(key)
+                    if was_inside is not None and key not in was_inside:
+                        self.add_proximity_event(tick, kind, radius, oid1, oid2)
+                    continue
+                entry = entry_time(coefs, radius, ticks)
+                if entry is None:
+                    continue
+                self.add_proximity_event(tick + entry, kind, radius, oid1, oid2)
+        return inside
+
+    def find_pairs(self, positions, velocities, accelerations, ticks, oids=None):
+        """
+        Candidate pairs of which at least one is of the given objects (by
+        default the moving objects). Only the objects that are not in the
+        static index, or moved since it was built, are swept.
+        """
+        if self.static_index is None or self.static_index.object_count != len(positions):
+            self.static_index = StaticIndex(positions, velocities, accelerations, self.max_radius)
+        index = self.static_index
+        if oids is None:
+            dynamic = index.dynamic
+            oids = dynamic[is_moving(velocities[dynamic], accelerations[dynamic])]
+        else:
+            index.set_moved(oids)
+            dynamic = index.dynamic
+        # The given objects are dynamic, and dynamic objects are sorted
+        subjects = np.zeros(len(dynamic), dtype=np.bool_)
+        subjects[np.searchsorted(dynamic, oids)] = True
+        a, b = sweep_and_prune(
+            positions[dynamic], velocities[dynamic], accelerations[dynamic],
+            ticks, self.max_radius, subjects)
+        lower, upper = swept_bounds(positions[oids], velocities[oids], accelerations[oids], ticks)
+        static_a, static_b = index.query(oids, lower - self.max_radius / 2, upper + self.max_radius / 2)
+        return np.concatenate([dynamic[a], static_a]), np.concatenate([dynamic[b], static_b])
+
+    def add_proximity_event(self, tick, kind, radius, oid1, oid2):
+        uid = random.random()
+        self.pending[uid] = tick, kind, radius, oid1, oid2
+        self.universe.add_event(uid, tick, self.handle_event,
+            f'Proximity {kind}: {oid1} <-> {oid2} ({radius})')
+
+    def handle_event(self, uid):
+        if uid not in self.pending:
+            # Predicted again since
+            return
+        tick, kind, radius, oid1, oid2 = self.pending.pop(uid)
+        positions = self.universe.positions
+        dist = np.linalg.norm(positions[oid2] - positions[oid1])
+        # Flight plans may have changed since the scan that predicted this event
+        if dist > radius * (1 + 10**-6) + EPSILON:
+            logger.debug('Obsolete proximity {} event: {} <-> {} at {:.3f} ({})', kind, oid1, oid2, dist, radius)
+            return
+        logger.debug('Proximity {}: {} <-> {} at {:.3f} ({})', kind, oid1, oid2, dist, radius)
+        self.inside.add((kind, oid1, oid2))
+        player_oid = self.universe.get_player_oid()
+        if player_oid in (oid1, oid2):
+            other = self.universe.ds_objects[oid2 if oid1 == player_oid else oid1]
+            self.universe.output_feedback(f'<orange>Proximity {kind}</orange>: {other.label} ({dist:.1f})')
+
+
+class StaticIndex:
+    """
+    Objects that were not moving when the index was built, sorted once
+    along one axis, such that the swept bounds of other objects are matched
+    against them by binary search. Objects that move later (their
+    acceleration changes) are marked as moved, and become dynamic: they are
+    left out of queries and swept with the moving objects instead.
+    """
+    def __init__(self, positions, velocities, accelerations, radius):
+        self.object_count = len(positions)
+        self.half_radius = radius / 2
+        moving = is_moving(velocities, accelerations)
+        self.moved = moving.copy()
+        # Sorted object IDs of objects that are not indexed or have moved since
+        self.dynamic = np.flatnonzero(moving)
+        static = np.flatnonzero(~moving)
+        # Along the axis with the most spread
+        self.axis = np.argmax(np.var(positions[static], axis=0)) if len(static) else 0
+        self.oids = static[np.argsort(positions[static, self.axis], kind='stable')]
+        self.positions = positions[self.oids]
+        self.keys = self.positions[:, self.axis]
+
+    def set_moved(self, oids):
+        oids = np.asarray(oids)
+        new = oids[~self.moved[oids]]
+        if len(new):
+            self.moved[new] = True
+            self.dynamic = np.union1d(self.dynamic, new)
+
+    def query(self, oids, lower, upper):
+        """Pairs of the objects with bounds and the indexed objects that have not moved, whose bounds (padded by radius) overlap."""
+        half = self.half_radius
+        starts = np.searchsorted(self.keys, lower[:, self.axis] - half, side='left')
+        stops = np.searchsorted(self.keys, upper[:, self.axis] + half, side='right')
+        which, found = _expand_ranges(starts, stops)
+        a = oids[which]
+        b = self.oids[found]
+        position = self.positions[found]
+        overlap = np.all((lower[which] <= position + half) & (position - half <= upper[which]), axis=1)
+        keep = overlap & ~self.moved[b] & (a != b)
+        return a[keep], b[keep]
+
+
+def is_moving(velocities, accelerations):
+    return np.any(velocities != 0, axis=1) | np.any(accelerations != 0, axis=1)
+
+
+def swept_bounds(positions, velocities, accelerations, ticks):
+    """Axis-aligned bounds of the paths of objects under constant acceleration over a number of ticks."""
+    end = positions + velocities * ticks + accelerations * (ticks ** 2) / 2
+    # Each axis is a parabola, the vertex may lie within the swept interval
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vertex_ticks = np.where(accelerations != 0, -velocities / accelerations, 0)
+    vertex_ticks = np.clip(vertex_ticks, 0, ticks)
+    vertex = positions + velocities * vertex_ticks + accelerations * (vertex_ticks ** 2) / 2
+    lower = np.minimum(np.minimum(positions, end), vertex)
+    upper = np.maximum(np.maximum(positions, end), vertex)
+    return lower, upper
+
+
+def sweep_and_prune(positions, velocities, accelerations, ticks, radius, subjects=None):
+    """
+    Pairs of object indices whose swept bounds (padded by radius) overlap,
+    of which at least one is a subject (a boolean mask, by default the
+    moving objects). Pairs of two other objects are never enumerated.
+    """
+    if subjects is None:
+        subjects = is_moving(velocities, accelerations)
+    empty = np.zeros(0, dtype=np.int64)
+    if not subjects.any():
+        return empty, empty
+    lower, upper = swept_bounds(positions, velocities, accelerations, ticks)
+    lower -= radius / 2
+    upper += radius / 2
+    # Sweep along the axis with the most spread
+    axis = np.argmax(np.var(lower + upper, axis=0))
+    order = np.argsort(lower[:, axis], kind='stable')
+    sorted_lower = lower[order, axis]
+    sorted_upper = upper[order, axis]
+    # Each box overlaps the boxes after it in the sweep that start before it ends
+    ranks = np.arange(len(order))
+    ends = np.searchsorted(sorted_lower, sorted_upper, side='right')
+    is_subject = subjects[order]
+    # Subjects against every box after them
+    first, second = _expand_ranges(ranks[is_subject] + 1, ends[is_subject])
+    a = [order[ranks[is_subject][first]]]
+    b = [order[second]]
+    # Other boxes against the subjects after them, swept separately
+    subject_ranks = np.flatnonzero(is_subject)
+    others = ~is_subject
+    starts = np.searchsorted(subject_ranks, ranks[others], side='right')
+    stops = np.searchsorted(sorted_lower[subject_ranks], sorted_upper[others], side='right')
+    first, second = _expand_ranges(starts, stops)
+    a.append(order[ranks[others][first]])
+    b.append(order[subject_ranks[second]])
+    a = np.concatenate(a)
+    b = np.concatenate(b)
+    # Prune by the remaining axes
+    overlap = np.all((lower[a] <= upper[b]) & (lower[b] <= upper[a]), axis=1)
+    return a[overlap], b[overlap]
+
+
+def _expand_ranges(starts, stops):
+    """Index of the range and position within it for every item of ranges [start, stop)."""
+    counts = np.maximum(stops - starts, 0)
+    total = counts.sum()
+    which = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return which, starts[which] + offsets
+
+
+def distance_polynomial(dp, dv, da):
+    """Coefficients (highest power first) of the squared distance over time given relative position, velocity and acceleration."""
+    return np.asarray([
+        np.dot(da, da) / 4,
+        np.dot(dv, da),
+        np.dot(dv, dv) + np.dot(dp, da),
+        2 * np.dot(dp, dv),
+        np.dot(dp, dp),
+    ])
+
+
+def closest_approach(coefs, ticks):
+    """Tick and distance of closest approach within ticks given a squared distance polynomial."""
+    candidates = [0, ticks, *_real_roots(np.polyder(coefs), ticks)]
+    sq_dists = np.polyval(coefs, candidates)
+    idx = np.argmin(sq_dists)
+    return candidates[idx], np.sqrt(max(sq_dists[idx], 0))
+
+
+def is_within(coefs, radius):
+    """If the distance is within radius at the start of a squared distance polynomial."""
+    return coefs[-1] <= radius ** 2
+
+
+def entry_time(coefs, radius, ticks):
+    """First tick within ticks of entering radius given a squared distance polynomial, or None."""
+    if is_within(coefs, radius):
+        return None
+    shifted = coefs - [0, 0, 0, 0, radius ** 2]
+    roots = _real_roots(shifted, ticks)
+    if not roots:
+        return None
+    return min(roots)
+
+
+def _real_roots(coefs, ticks):
+    if not np.any(coefs):
+        return []
+    roots = np.roots(coefs)
+    real = roots.real[np.abs(roots.imag) <= ROOT_TOLERANCE * np.maximum(1, np.abs(roots.real))]
+    return [r for r in real if 0 < r <= ticks]
@@ -0,0 +1,66 @@
+from loguru import logger
+import numpy as np
+
+
+SORT_KEYS = ('oid', 'dist', 'speed', 'acc')
+
+
+class ObjectQuery:
+    """Filter and sort deep space objects in one vectorized pass over the engine columns."""
+    def __init__(self, universe):
+        self.universe = universe
+        self._columns = {}
+
+    def run(self, oids=None, fid=None, type_name=None, moving=False, within=None,
+            sort_by='oid', descending=False, offset=0, limit=None):
+        """Returns a page of oids matching the query, and the total number of matches."""
+        assert sort_by in SORT_KEYS
+        self._columns = {}
+        count = self.universe.object_count
+        if oids is None:
+            mask = np.ones(count, dtype=np.bool_)
+        else:
+            mask = np.zeros(count, dtype=np.bool_)
+            mask[oids] = True
+        if fid is not None:
+            mask &= self.universe.fids == fid
+        if type_name is not None:
+            mask &= self.universe.get_type_mask(type_name)
+        if moving:
+            mask &= self.get_column('speed') > 0
+        if within is not None:
+            mask &= self.get_column('dist') <= within
+        selected = np.flatnonzero(mask)
+        total = len(selected)
+        if sort_by == 'oid':
+            if descending:
+                selected = selected[::-1]
+            stop = None if limit is None else offset + limit
+            return selected[offset:stop], total
+        keys = self.get_column(sort_by)[selected]
+        if descending:
+            keys = -keys
+        # Partition to find the top results, only those need sorting
+        top = total if limit is None else min(total, offset + limit)
+        if top < total:
+            part = np.argpartition(keys, top - 1)[:top]
+        else:
+            part = np.arange(total)
+        part = part[np.argsort(keys[part], kind='stable')]
+        return selected[part[offset:top]], total
+
+    def get_column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self._get_column(name)
+        return self._columns[name]
+
+    def _get_column(self, name):
+        if name == 'oid':
+            return np.arange(self.universe.object_count)
+        if name == 'dist':
+            return np.linalg.norm(self.universe.positions - self.universe.player.position, axis=-1)
+        if name == 'speed':
+            return np.linalg.norm(self.universe.velocities, axis=-1)
+        if name == 'acc':
+            return np.linalg.norm(self.universe.engine.get_derivative_second('position'), axis=-1)
+        raise KeyError(f'Unknown query column: {name}')
@@ -0,0 +1,85 @@
+from loguru import logger
+from collections import defaultdict, OrderedDict
+import numpy as np
+
+
+class SearchIndex:
+    """Substring index over object labels and fleet membership.
+
+    Labels are indexed by all their lowercase n-grams (up to NGRAM_SIZE
+    characters). Longer queries intersect the postings of their n-grams
+    and verify the remaining candidates. The results of the most recent
+    queries are cached until the next object is added.
+    """
+    NGRAM_SIZE = 3
+    CACHE_SIZE = 256
+
+    def __init__(self):
+        self.labels = []
+        self.ngrams = defaultdict(list)
+        self.fleets = defaultdict(list)
+        self.version = 0
+        self._cache = OrderedDict()
+
+    def add(self, oid, label, fid=None):
+        assert oid == len(self.labels)
+        label = label.lower()
+        self.labels.append(label)
+        # Oids are added in order, such that postings are always sorted
+        for gram in self._get_ngrams(label):
+            self.ngrams[gram].append(oid)
+        if fid is not None:
+            self.fleets[fid].append(oid)
+        self.version += 1
+        self._cache.clear()
+
+    def search(self, text=None, fid=None, offset=0, limit=None):
+        oids = self._search(text, fid)
+        stop = None if limit is None else offset + limit
+        return oids[offset:stop]
+
+    def count(self, text=None, fid=None):
+        return len(self._search(text, fid))
+
+    def _search(self, text, fid):
+        # An empty text matches every label
+        text = text.lower() if text else None
+        key = text, fid
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        oids = np.arange(len(self.labels))
+        if text is not None:
+            oids = self._search_text(text)
+        if fid is not None:
+            fleet = np.asarray(self.fleets.get(fid, []), dtype=oids.dtype)
+            oids = np.intersect1d(oids, fleet, assume_unique=True)
+        oids.flags.writeable = False
+        self._cache[key] = oids
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return oids
+
+    def _search_text(self, text):
+        if len(text) <= self.NGRAM_SIZE:
+            return np.asarray(self.ngrams.get(text, []), dtype=np.int64)
+        grams = self._get_ngrams(text, min_size=self.NGRAM_SIZE)
+        postings = sorted((self.ngrams.get(g, []) for g in grams), key=len)
+        candidates = np.asarray(postings[0], dtype=np.int64)
+        for posting in postings[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        # Having all n-grams does not guarantee a match
+        return np.asarray([oid for oid in candidates if text in self.labels[oid]], dtype=np.int64)
+
+    @classmethod
+    def _get_ngrams(cls, text, min_size=1):
+        return {
+            text[i:i+size]
+            for size in range(min_size, cls.NGRAM_SIZE+1)
+            for i in range(len(text)-size+1)
+        }
+
+    def __len__(self):
+        return len(self.labels)
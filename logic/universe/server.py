@@ -0,0 +1,130 @@
+from loguru import logger
+import pickle
+import time
+from pathlib import Path
+
+from util.config import CONFIG_DATA
+from util.controller import Controller
+from util.logs import add_log_file
+from util.shared import SharedFrames
+from logic.universe.universe import Universe
+
+
+def run_server(connection):
+    """Process target of the simulation server, see SimulationServer."""
+    # Spawned without the sinks of the GUI process
+    logger.remove()
+    add_log_file(Path.cwd() / 'debug-server.log')
+    universe = Universe(Controller('Server'))
+    try:
+        SimulationServer(universe, connection).run()
+    finally:
+        logger.complete()
+
+
+class SimulationServer:
+    """
+    Owns the Universe in split mode. Commands and window requests arrive
+    from the GUI over a pipe, and every change is published as a frame of
+    status and rendered window contents in shared memory. When a frame
+    outgrows the shared memory, a larger region is created and its name
+    sent to the GUI.
+    """
+    def __init__(self, universe, connection):
+        self.universe = universe
+        self.connection = connection
+        self.frames = None
+        # Window name: (size, universe versions the content depends on)
+        self.windows = {}
+        # Window name: (state, content)
+        self.contents = {}
+        self.published_status = None
+        self.last_message_time = time.perf_counter()
+        self.running = True
+        self.create_frames(CONFIG_DATA['SERVER_SLOT_SIZE'])
+
+    def create_frames(self, slot_size):
+        if self.frames is not None:
+            self.frames.close()
+            self.frames.unlink()
+        self.frames = SharedFrames.create(slot_size)
+        self.connection.send(('frames', self.frames.name))
+
+    def run(self):
+        logger.info('Simulation server started')
+        self.universe.gui_prepared()
+        frame_time = 1 / CONFIG_DATA['LOGIC_FPS']
+        try:
+            while self.running:
+                next_frame = time.perf_counter() + frame_time
+                self.universe.update()
+                self.publish()
+                # Wait for commands until the next frame
+                timeout = next_frame - time.perf_counter()
+                if self.is_idle():
+                    timeout = 1 / CONFIG_DATA['IDLE_FPS']
+                while self.running and self.connection.poll(max(0, timeout)):
+                    self.handle_message(*self.connection.recv())
+                    self.last_message_time = time.perf_counter()
+                    timeout = next_frame - time.perf_counter()
+        except EOFError:
+            logger.warning('Simulation server lost the GUI connection')
+        finally:
+            self.frames.close()
+            self.frames.unlink()
+            logger.info('Simulation server stopped')
+
+    def is_idle(self):
+        if self.universe.is_animating:
+            return False
+        return time.perf_counter() - self.last_message_time > CONFIG_DATA['IDLE_DELAY']
+
+    def handle_message(self, kind, *args):
+        if kind == 'input':
+            self.universe.handle_input(*args)
+        elif kind == 'feedback':
+            self.universe.output_feedback(*args)
+        elif kind == 'batch':
+            request_id, batch = args
+            self.connection.send(('batch', request_id, self.universe.run_batch(batch)))
+        elif kind == 'windows':
+            self.windows = args[0]
+        elif kind == 'quit':
+            self.running = False
+        else:
+            logger.warning('Simulation server ignoring unknown message: {}', kind)
+
+    def update_contents(self):
+        """Refresh the contents of requested windows, returns if any changed."""
+        changed = False
+        for name, (size, depends) in self.windows.items():
+            last_state, last_content = self.contents.get(name, (None, None))
+            state = size, None if depends is None else self.universe.get_versions(depends)
+            if depends is not None and state == last_state:
+                continue
+            content = self.universe.get_window_content(name, size)
+            if content is None or content == last_content:
+                self.contents[name] = state, last_content
+                continue
+            self.contents[name] = state, content
+            changed = True
+        return changed
+
+    def publish(self):
+        changed = self.update_contents()
+        status = {
+            'tick': self.universe.tick,
+            'auto_simrate': self.universe.auto_simrate,
+            'feedback_str': self.universe.feedback_str,
+            'is_animating': self.universe.is_animating,
+        }
+        if not changed and status == self.published_status:
+            return
+        self.published_status = status
+        payload = pickle.dumps(status | {
+            'windows': {name: content for name, (state, content) in self.contents.items()},
+        })
+        if not self.frames.write(payload):
+            frame_size = self.frames.get_frame_size(len(payload))
+            self.create_frames(max(frame_size, 2 * self.frames.slot_size))
+            self.frames.write(payload)
@@ -1,34 +1,47 @@
 from loguru import logger
-from pathlib import Path
 import arrow
 import math
 import numpy as np
 import random
 import itertools
+import time
 from functools import partial
 from collections import deque
 from inspect import signature
 
 from util import (
-    file_load,
     is_number,
     is_index,
     format_vector,
     format_latlong,
     escape_html,
     escape_if_malformed,
+    parse_markup,
+    parse_markup_escaped,
+    join_formatted_lines,
     CELESTIAL_NAMES,
     )
+from prompt_toolkit.formatted_text import FormattedText
+from prompt_toolkit.formatted_text.utils import split_lines, fragment_list_to_text
 from util.argparse import arg_validation
 from util.config import CONFIG_DATA
 from util.argparse import EXAMPLE_SPECSTRING
 from util.controller import Controller
+from util.logs import LOG_TAIL, LOG_SAMPLER
 from util._3d import latlong_single
 from logic.universe.events import EventQueue
 from logic.universe.engine import Engine
+from logic.universe.proximity import ProximityDetector
+from logic.universe.search import SearchIndex
+from logic.universe.query import ObjectQuery, SORT_KEYS
+from logic.universe.hierarchy import Hierarchy
 from logic.dso.dso import DeepSpaceObject
 from logic.dso.celestial import CelestialObject, SMBH, Star, Rock
 from logic.dso.ship import Ship
+from logic.dso.classes import (
+    TYPE_NAMES, TYPE_CELESTIAL, TYPE_SHIP, NO_FID, NO_PARENT,
+    CLASS_IDS, CLASS_TYPES, CLASS_NAMES, CLASS_ICONS, CLASS_COLORS,
+    )
 from logic.command.admiral import Player, Agent
 
 
@@ -48,15 +61,27 @@ class Universe:
         self.display_controller = Controller('Logic Display', feedback=self.output_feedback)
         self.console_stack = deque()
         self.feedback_stack = deque()
-        self.engine = Engine({'position': 3})
+        self.__feedback_str = ''
+        # Incremented on changes, such that windows can skip refreshing unchanged content
+        self.versions = dict.fromkeys(['console', 'feedback', 'tick', 'events', 'command'], 0)
+        self.engine = Engine({'position': 3}, columns={
+            'type_id': (np.int8, TYPE_NAMES.index('object')),
+            'class_id': (np.int16, 0),
+            'fid': (np.int32, NO_FID),
+            'parent': (np.int32, NO_PARENT),
+        })
         self.events = EventQueue()
         self.tick = 0
         self.__last_tick_time = arrow.now()
         self.auto_simrate = CONFIG_DATA['DEFAULT_SIMRATE']
         self.admirals = []
         self.ds_objects = []
-        self.ds_celestials = self.ds_ships = np.ndarray((0), dtype=np.bool)
+        self.ds_names = []
+        self.search_index = SearchIndex()
+        self._hierarchy = None
         self.genesis()
+        self.proximity = ProximityDetector(self)
+        self.proximity.setup()
         self.register_commands(controller)
         self.register_display_cache()
         self.output_feedback('<orange><bold>Welcome to space.</bold></orange>')
@@ -84,6 +109,7 @@ class Universe:
             controller.register_command(*command)
 
     def handle_input(self, input_text, allow_aliases=True):
+        self.versions['command'] += 1
         if PROMPT_LINE_SPLIT in input_text:
             lines = input_text.split(PROMPT_LINE_SPLIT)
         elif PROMPT_LINE_SPLIT_ESCAPE in input_text:
@@ -107,16 +133,59 @@ class Universe:
             if not is_silent and isinstance(r, str):
                 self.output_console(f'>> {str(r)[:100]}')
 
+    def run_batch(self, batch):
+        """
+        Run a batch of commands, each a list of the command name followed by
+        its arguments, without echoing them in the console. Browser pages
+        return their content. Returns the result of each command and how
+        long it took in ms.
+        """
+        self.versions['command'] += 1
+        results = []
+        for command, *args in batch:
+            start = time.perf_counter()
+            entry = {'command': command}
+            try:
+                # Arguments are passed as a list, they may contain spaces
+                if self.controller.has(command):
+                    entry['result'] = self.controller.do_command(command, args)
+                elif self.display_controller.has(command):
+                    entry['result'] = self.display_controller.do_command(command, args)
+                else:
+                    entry['error'] = f'Command "{command}" not found'
+            except Exception as e:
+                logger.opt(exception=e).warning('Batch command {} failed', command)
+                entry['error'] = repr(e)
+            if 'result' in entry:
+                entry['result'] = self.get_plain_result(entry['result'])
+            entry['ms'] = (time.perf_counter() - start) * 1000
+            results.append(entry)
+        return results
+
+    @staticmethod
+    def get_plain_result(result):
+        if result is None or isinstance(result, (bool, int, float, str)):
+            return result
+        if isinstance(result, FormattedText):
+            return fragment_list_to_text(result)
+        if isinstance(result, np.generic):
+            return result.item()
+        return str(result)
+
     def output_console(self, message):
-        message = escape_if_malformed(message, indicate_escaped=True)
+        # Messages are parsed once, and stored as formatted text
+        if not isinstance(message, FormattedText):
+            message = parse_markup(str(message), indicate_escaped=True, cache=False)
         self.console_stack.appendleft(message)
+        self.versions['console'] += 1
         while len(self.console_stack) > CONSOLE_SCROLLBACK:
             self.console_stack.pop()
 
     def output_feedback(self, message, also_console=True):
-        logger.debug(f'output_feedback: {message}')
-        message = escape_if_malformed(message)
+        logger.debug('output_feedback: {}', message)
+        self.__feedback_str, message = parse_markup_escaped(message)
         self.feedback_stack.appendleft(message)
+        self.versions['feedback'] += 1
         while len(self.feedback_stack) > FEEDBACK_SCROLLBACK:
             self.feedback_stack.pop()
         if also_console:
@@ -125,6 +194,7 @@ class Universe:
     def clear_console(self):
         """Clear the console"""
         self.console_stack.clear()
+        self.versions['console'] += 1
 
     def echo(self, message):
         """ArgSpec
@@ -171,6 +241,12 @@ class Universe:
             if ticks > 0:
                 self.do_ticks(ticks)
 
+    @property
+    def is_animating(self):
+        """If the simulation is running or the player camera is swiveling."""
+        # Tracking a target only turns the camera when the simulation is running
+        return self.auto_simrate > 0 or self.player.my_ship.cockpit.camera.swiveling
+
     def do_until_event(self):
         """Run simulation until but not including next event"""
         self.do_ticks(self.events.next.tick - self.tick - TINY_TICK)
@@ -195,13 +271,17 @@ class Universe:
         while next_event:
             intermediate_ticks = next_event.tick - self.tick
             self.__do_ticks(intermediate_ticks)
-            logger.debug(f'Handling event {next_event.uid} @{self.tick}: {next_event.description} ({next_event.callback})')
+            if LOG_SAMPLER('event'):
+                logger.debug('Handling event {} @{}: {} ({})',
+                    next_event.uid, self.tick, next_event.description, next_event.callback)
             next_event.callback(next_event.uid)
+            self.versions['events'] += 1
             next_event = self.events.pop_next(tick=last_tick)
         intermediate_ticks = last_tick - self.tick
         self.__do_ticks(intermediate_ticks)
 
     def __do_ticks(self, ticks):
+        self.versions['tick'] += 1
         self.tick += ticks
         self.engine.tick(ticks)
         self.__last_tick_time = arrow.now()
@@ -251,6 +331,7 @@ class Universe:
             logger.error(m)
             raise ValueError(m)
         self.events.add(uid, tick, callback, description)
+        self.versions['events'] += 1
 
     @property
     def positions(self):
@@ -267,12 +348,15 @@ class Universe:
         ds_object = dso_cls(universe=self, oid=new_oid)
         assert isinstance(ds_object, DeepSpaceObject)
         self.ds_objects.append(ds_object)
-        is_ship = isinstance(ds_object, Ship)
-        is_celestial = isinstance(ds_object, CelestialObject)
-        self.ds_ships = np.concatenate((self.ds_ships, [is_ship]))
-        self.ds_celestials = np.concatenate((self.ds_celestials, [is_celestial]))
-        assert self.object_count == len(self.ds_objects) == len(self.ds_ships) == len(self.ds_celestials)
+        self.ds_names.append(None)
+        assert self.object_count == len(self.ds_objects) == len(self.ds_names)
+        class_id = CLASS_IDS[dso_cls]
+        self.engine.get_column('class_id')[new_oid] = class_id
+        self.engine.get_column('type_id')[new_oid] = CLASS_TYPES[class_id]
+        self.engine.get_column('fid')[new_oid] = kwargs.get('fid', NO_FID)
         ds_object.setup(**kwargs)
+        fid = kwargs.get('fid')
+        self.search_index.add(new_oid, ds_object.label, fid)
         return ds_object
 
     @property
@@ -286,22 +370,59 @@ class Universe:
             return False
         return True
 
-    def search_oids(self, filter_name=None, fleet_id=None):
-        objects = set()
+    def search_oids(self, filter_name=None, fleet_id=None, offset=0, limit=None):
         if filter_name is not None:
             assert isinstance(filter_name, str)
-            filter_name = filter_name.lower()
-        for ob in self.ds_objects:
-            if fleet_id is not None:
-                if not isinstance(ob, Ship):
-                    continue
-                if not ob.oid in self.admirals[fleet_id].fleet_oids:
-                    continue
-            if filter_name is not None:
-                if filter_name not in ob.label.lower():
-                    continue
-            objects.add(ob.oid)
-        return objects
+        return self.search_index.search(filter_name, fleet_id, offset, limit)
+
+    @property
+    def type_ids(self):
+        return self.engine.get_column('type_id')
+
+    @property
+    def class_ids(self):
+        return self.engine.get_column('class_id')
+
+    @property
+    def fids(self):
+        return self.engine.get_column('fid')
+
+    @property
+    def parents(self):
+        return self.engine.get_column('parent')
+
+    @property
+    def hierarchy(self):
+        """Hierarchy of celestial objects, rebuilt when objects are added."""
+        if self._hierarchy is None or len(self._hierarchy.counts) != self.object_count:
+            self._hierarchy = Hierarchy(self.parents, self.positions, self.ds_celestials)
+        return self._hierarchy
+
+    @property
+    def ds_ships(self):
+        return self.type_ids == TYPE_SHIP
+
+    @property
+    def ds_celestials(self):
+        return self.type_ids == TYPE_CELESTIAL
+
+    @property
+    def object_icons(self):
+        return CLASS_ICONS[self.class_ids]
+
+    @property
+    def object_colors(self):
+        return CLASS_COLORS[self.class_ids]
+
+    @property
+    def type_names(self):
+        return {*TYPE_NAMES, *CLASS_NAMES}
+
+    def get_type_mask(self, type_name):
+        if type_name in TYPE_NAMES:
+            return self.type_ids == TYPE_NAMES.index(type_name)
+        class_mask = CLASS_NAMES == type_name
+        return class_mask[self.class_ids]
 
     # Admirals
     def add_player(self, name):
@@ -327,12 +448,12 @@ class Universe:
         return len(self.admirals)
 
     def is_fid(self, fid):
-        logger.debug(f'is_fid: {fid} {type(fid)}')
+        logger.debug('is_fid: {} {}', fid, type(fid))
         if not is_index(fid):
-            logger.debug(f'is_fid: not index')
+            logger.debug('is_fid: not index')
             return False
         if fid < 0 or fid >= self.admiral_count:
-            logger.debug(f'is_fid: not in range')
+            logger.debug('is_fid: not in range')
             return False
         return True
 
@@ -369,6 +490,18 @@ class Universe:
         self.display_controller.cache('help.commandline', EXAMPLE_SPECSTRING)
         self.display_controller.cache('hotkeys', self.__get_content_hotkeys())
 
+    def get_versions(self, names):
+        return tuple(self.get_version(name) for name in names)
+
+    def get_version(self, name):
+        if name == 'camera':
+            return self.player.my_ship.cockpit.camera.state
+        if name == 'render':
+            return self.player.my_ship.cockpit.render_version
+        if name == 'log':
+            return LOG_TAIL.version
+        return self.versions[name]
+
     def get_window_content(self, name, size=NO_SIZE_LIMIT):
         if hasattr(self, f'get_content_{name}'):
             f = getattr(self, f'get_content_{name}')
@@ -389,30 +522,65 @@ class Universe:
         return self.stack_content(self.feedback_stack, size)
 
     def get_content_objects(self,
-            filter_name=None, fleet_id=None,
-            max_entries=30, size=NO_SIZE_LIMIT):
+            filter_name=None, fleet_id=None, type_name=None,
+            moving=False, within=None, sort_by='oid', descending=False,
+            max_entries=30, page_index=1, size=NO_SIZE_LIMIT):
         """ArgSpec
         Retrieve info on deep space objects
+
+        Objects can be filtered and sorted by distance from the player, speed and acceleration, for example:
+        browse objects --type fighter --sort dist --max 30
+        browse objects --moving --sort speed --desc
         ___
         +FILTER_NAME Text in object names to filter for
         -+fleet FLEET_ID Fleet ID to filter for
+        -+type TYPE_NAME Object type to filter for (e.g. ship, celestial, fighter, rock)
+        -+moving MOVING Show only moving objects
+        -+within WITHIN Show only objects within this distance of the player
+        -+sort SORT_BY Sort by: oid, dist, speed, acc
+        -+desc DESCENDING Sort in descending order
         -+max MAX_ENTRIES Maximum number of objects to show
+        -+p PAGE_INDEX Page of results to show
         """
         if filter_name is not None:
             filter_name = str(filter_name)
         if fleet_id is not None:
             with arg_validation(f'Invalid fleet ID'):
                 assert self.is_fid(fleet_id)
+        if type_name is not None:
+            with arg_validation(f'Unknown object type: {type_name}'):
+                assert type_name in self.type_names
+        if within is not None:
+            with arg_validation(f'WITHIN must be a positive number'):
+                assert is_number(within)
+                assert within > 0
+        with arg_validation(f'SORT_BY must be one of: {", ".join(SORT_KEYS)}'):
+            assert sort_by in SORT_KEYS
         with arg_validation(f'MAX_ENTRIES must be a positive integer'):
             assert isinstance(max_entries, int)
             assert max_entries > 0
-        filtered_oids = self.search_oids(filter_name=filter_name, fleet_id=fleet_id)
-        object_summaries = [f'<h2>Deep Space Objects</h2>']
-        for i, oid in enumerate(filtered_oids):
-            if i >= max_entries:
-                break
+        with arg_validation(f'PAGE_INDEX must be a positive integer'):
+            assert isinstance(page_index, int)
+            assert page_index > 0
+        oids = None
+        if filter_name is not None:
+            oids = self.search_oids(filter_name=filter_name)
+        query = ObjectQuery(self)
+        filtered_oids, total = query.run(
+            oids=oids, fid=fleet_id, type_name=type_name, moving=moving, within=within,
+            sort_by=sort_by, descending=descending,
+            offset=(page_index - 1) * max_entries, limit=max_entries)
+        page_count = max(1, math.ceil(total / max_entries))
+        object_summaries = [
+            f'<h2>Deep Space Objects</h2>',
+            f'<red>Found</red>: <code>{total}</code> <red>Page</red>: <code>{page_index}/{page_count}</code>',
+        ]
+        sort_values = query.get_column(sort_by) if sort_by != 'oid' else None
+        for oid in filtered_oids:
             ob = self.ds_objects[oid]
             line = f'<{ob.color}>{ob.label} ({ob.type_name})</{ob.color}>'
+            if sort_values is not None:
+                line = f'{line} <code>{sort_by}: {sort_values[oid]:.3e}</code>'
             if isinstance(ob, Ship):
                 orders = f'<italic>{ob.current_orders}</italic>'
                 line = f'{line:<50} {orders}'
@@ -420,9 +588,7 @@ class Universe:
         return '\n'.join(object_summaries)
 
     def get_content_debug(self, size=NO_SIZE_LIMIT):
-        logfile = file_load(Path.cwd() / 'debug.log')
-        log_lines = logfile.split('\n')
-        return '\n'.join(escape_if_malformed(l) for l in log_lines[-size[1]:])
+        return '\n'.join(LOG_TAIL.tail(size[1]))
 
     def get_content_sim(self, size=NO_SIZE_LIMIT):
         t = arrow.get().format('YY-MM-DD, hh:mm:ss')
@@ -455,9 +621,12 @@ class Universe:
         ])
 
     def get_content_cockpit(self, size=NO_SIZE_LIMIT):
-        return '\n'.join([
-            self.get_content_inspect(oid=self.player.my_ship.oid),
-        ])
+        my_ship = self.player.my_ship
+        lines = [self.get_content_inspect(oid=my_ship.oid)]
+        hover_oid = my_ship.cockpit.get_hover_oid()
+        if hover_oid is not None and hover_oid != my_ship.oid:
+            lines.extend(['', '<h2>Crosshair</h2>', self.get_content_inspect(oid=hover_oid)])
+        return '\n'.join(lines)
 
     def get_content_browser(self, size=NO_SIZE_LIMIT):
         command = self.display_controller.do_command('__browser_page')
@@ -498,8 +667,9 @@ class Universe:
                 f'<red>Current orders</red>:',
                 f'<italic>{ob.current_orders}</italic>',
             ])
-            look = latlong_single(ob.cockpit.camera.current_axes[0])
-            extra_lines.append(f'<red>Looking</red>: <code>{format_latlong(look)}</code>')
+            if ob.has_cockpit:
+                look = latlong_single(ob.cockpit.camera.current_axes[0])
+                extra_lines.append(f'<red>Looking</red>: <code>{format_latlong(look)}</code>')
         title_name = f'<white>#{ob.oid:>3} {escape_if_malformed(ob.name)}</white>'
         title_type = f' <{color}>({escape_html(ob_type)})</{color}>'
         return '\n'.join([
@@ -598,6 +768,7 @@ class Universe:
         with arg_validation(f'Couldn\'t find page: {page}'):
             assert self.display_controller.has(page)
 
+        koptions = self.resolve_page_koptions(page, koptions)
         s = self.display_controller.do_command(page,
             custom_args=options, custom_kwargs=koptions)
         self.output_console(s)
@@ -616,10 +787,17 @@ class Universe:
         with arg_validation(f'Couldn\'t find page: {page}'):
             assert self.display_controller.has(page)
 
+        koptions = self.resolve_page_koptions(page, koptions)
         self.display_controller.cache('__browser_page', page)
         self.display_controller.cache('__browser_options', options)
         self.display_controller.cache('__browser_koptions', koptions)
 
+    def resolve_page_koptions(self, page, koptions):
+        if not self.display_controller.has_command(page):
+            return koptions
+        callback, argspec = self.display_controller.get_command(page)
+        return argspec.resolve_keys(koptions)
+
     def help(self, *args):
         """Show help"""
         self.print('help')
@@ -628,13 +806,14 @@ class Universe:
     def stack_content(self, stack, size=NO_SIZE_LIMIT):
         line_count = size[1]
         sliced = itertools.islice(stack, 0, line_count)
-        full = '\n'.join(reversed(list(sliced)))
-        lines = full.split('\n')[-line_count:]
-        return '\n'.join(lines)
+        lines = []
+        for message in reversed(list(sliced)):
+            lines.extend(split_lines(message))
+        return join_formatted_lines(lines[-line_count:])
 
     @property
     def feedback_str(self):
-        return self.feedback_stack[0]
+        return self.__feedback_str
 
     def __get_content_help(self):
         return HELP
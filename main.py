@@ -2,16 +2,23 @@ from loguru import logger
 from pathlib import Path
 import arrow
 
+# Importing the config logs, remove the default sink first
 logger.remove()
-logfile = Path.cwd() / 'debug.log'
-if logfile.is_file():
-    logfile.unlink()
-logger.add(logfile, rotation='5 MB', retention=2,
-    format='{level};{name}:{line}:: {message}')
-logger.info(f'Logging at {arrow.get()}')
+from util.logs import LOG_TAIL, LOG_FORMAT, get_log_levels, add_log_file
 
 
-from gui.gui import App
+# The simulation server process imports this module too
+if __name__ == '__main__':
+    add_log_file(Path.cwd() / 'debug.log')
+    log_level, log_filter = get_log_levels()
+    logger.add(LOG_TAIL, format=LOG_FORMAT, level=log_level, filter=log_filter, enqueue=True)
+    logger.info(f'Logging at {arrow.get()}')
 
-r = App().run()
-print(r)
+    from gui.gui import App
+
+    try:
+        r = App().run()
+    finally:
+        # Wait for the enqueued messages to be written
+        logger.complete()
+    print(r)
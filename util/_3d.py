@@ -119,6 +119,21 @@ class Quaternion:
             cls.rotate_vector(cls.norm_z(), q_),
         ]
 
+    @classmethod
+    def to_rotation_matrix(cls, q):
+        """Produce a 3x3 matrix that rotates 3d vectors (as column vectors) like rotate_vectors."""
+        assert q.shape == (4, )
+        w = q[0]
+        u = q[1:]
+        # q * v * q_ = (w² - |u|²)v + 2(u·v)u + 2w(u × v)
+        cross_matrix = np.asarray([
+            [0, -u[2], u[1]],
+            [u[2], 0, -u[0]],
+            [-u[1], u[0], 0],
+        ], dtype=np.float64)
+        r = (w**2 - np.dot(u, u)) * np.identity(3) + 2 * np.outer(u, u) + 2 * w * cross_matrix
+        return r
+
     @classmethod
     def multiply_many_one(cls, qr, qs):
         """Multiply many quaternions by a single quaternion. Returns resulting quaternions."""
@@ -205,7 +220,7 @@ def latlong_single(vector):
     return long, lat
 
 
-def latlong(vectors):
+def latlong(vectors, out=None, magnitude=None):
     """
     Given an observer at the origin, gives the longitude and latitude
     of vectors projected onto a sphere around the origin/observer,
@@ -217,22 +232,75 @@ def latlong(vectors):
     axis with the y+ axis to their left and the z+ axis atop them. We
     find the angles to rotate clockwise and pitch up in order to look at
     the vector.
+
+    Longitudes are in the range [-180°, 180°]. Results are written to the
+    `out` (n, 2) and `magnitude` (n,) buffers when given, which also sets
+    the precision (e.g. float32). Vectors of zero magnitude are at 0°, 0°.
+    """
+    dtype = out.dtype if out is not None else np.float64
+    if out is None:
+        out = np.empty((len(vectors), 2), dtype=dtype)
+    if magnitude is None:
+        magnitude = np.empty(len(vectors), dtype=dtype)
+    x, y, z = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+    long, lat = out[:, 0], out[:, 1]
+
+    np.arctan2(y, x, out=long)
+    np.multiply(long, -RADIANS_IN_DEGREES, out=long)
+
+    np.hypot(x, y, out=magnitude)
+    np.hypot(magnitude, z, out=magnitude)
+    # Pad the magnitude to avoid dividing by zero, z is zero for those vectors
+    np.maximum(magnitude, np.finfo(dtype).tiny, out=lat)
+    np.divide(z, lat, out=lat)
+    np.clip(lat, -1, 1, out=lat)
+    np.arcsin(lat, out=lat)
+    np.multiply(lat, RADIANS_IN_DEGREES, out=lat)
+    return out
+
+
+class Frustum:
+    """
+    The region of camera space (looking at x+, with y+ to the left and z+
+    up) that projects within a given angular extent of longitude and
+    latitude around the center of view.
+
+    Longitude is bounded by two planes through the camera position, and
+    latitude by a double cone around the vertical axis. An extent of 90°
+    or more in longitude includes points behind the camera.
     """
-    magnitude = np.linalg.norm(vectors, axis=-1)
-    has_mag = magnitude > 0
-    has_x = vectors[:, 0] != 0  # Avoid dividing by zero
-    has_y = vectors[:, 1] != 0
-    fix_theta = ~has_x & has_y  # Compensate for vectors with y component but no x
-
-    long = np.zeros(len(vectors), dtype=np.float64)
-    theta = np.arctan(vectors[has_x, 1] / vectors[has_x, 0])
-    theta[vectors[has_x, 0] < 0] += math.pi
-    long[has_x] = theta * RADIANS_IN_DEGREES * -1
-    long[fix_theta] = vectors[fix_theta, 1] / np.abs(vectors[fix_theta, 1]) * 90
-
-    lat = np.zeros(len(vectors), dtype=np.float64)
-    phi = np.arcsin(vectors[has_mag, 2] / magnitude[has_mag])
-    lat[has_mag] = phi * RADIANS_IN_DEGREES
-
-    r = np.stack((long, lat), axis=1)
-    return r
+    def __init__(self, half_long, half_lat):
+        self.half_long = half_long
+        self.half_lat = half_lat
+
+    def contains(self, vectors):
+        """Mask of camera space vectors within the frustum."""
+        return self._contains(vectors, self.half_long, self.half_lat)
+
+    def contains_spheres(self, centers, radii):
+        """Mask of camera space spheres that intersect the frustum."""
+        dist = np.linalg.norm(centers, axis=-1)
+        # Widen the extent by the angular radius of each sphere
+        with np.errstate(divide='ignore', invalid='ignore'):
+            margin = np.arcsin(np.minimum(1, radii / dist)) * RADIANS_IN_DEGREES
+        inside = dist <= radii
+        return inside | self._contains(centers, self.half_long + margin, self.half_lat + margin)
+
+    @staticmethod
+    def _contains(vectors, half_long, half_lat):
+        x, y, z = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+        mask = np.ones(len(vectors), dtype=np.bool_)
+        # Longitude planes: normals (sin a, ±cos a, 0)
+        if np.any(half_long < 180):
+            a = np.minimum(half_long, 180) / RADIANS_IN_DEGREES
+            sin_a, cos_a = np.sin(a), np.cos(a)
+            left = x * sin_a + y * cos_a >= 0
+            right = x * sin_a - y * cos_a >= 0
+            # Beyond 90° the visible region is the union of both half spaces
+            mask &= np.where(half_long < 90, left & right, left | right)
+        # Latitude cone: |z| * cos b <= sqrt(x² + y²) * sin b
+        if np.any(half_lat < 90):
+            b = np.minimum(half_lat, 90) / RADIANS_IN_DEGREES
+            sin_b, cos_b = np.sin(b), np.cos(b)
+            mask &= (z * cos_b) ** 2 <= (x ** 2 + y ** 2) * sin_b ** 2
+        return mask
@@ -1,7 +1,8 @@
 from loguru import logger
 import os, sys, traceback
 import numpy as np
-from prompt_toolkit.formatted_text import HTML
+from functools import lru_cache
+from prompt_toolkit.formatted_text import HTML, FormattedText
 
 RNG = np.random.default_rng()
 EPSILON = 10**-10
@@ -41,6 +42,7 @@ STYLE = {
     **COLOR_HEXES,
 }
 __TEST_FOR_INDEXING = tuple()
+MARKUP_CACHE_SIZE = 1024
 
 
 def file_dump(file, d, clear=True):
@@ -85,6 +87,50 @@ def escape_if_malformed(s, indicate_escaped=False):
     return s
 
 
+def parse_markup(s, indicate_escaped=False, cache=True):
+    """
+    Markup parsed to formatted text, escaped if malformed. Results are
+    cached for static markup, markup that changes every time (like
+    messages) should skip the cache. Returns a new FormattedText.
+    """
+    if not cache:
+        return _parse_markup(s, indicate_escaped)
+    return FormattedText(_parse_markup_cached(s, indicate_escaped))
+
+
+@lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def _parse_markup_cached(s, indicate_escaped):
+    # Immutable, such that callers cannot modify the cached fragments
+    return tuple(_parse_markup(s, indicate_escaped))
+
+
+def _parse_markup(s, indicate_escaped):
+    return parse_markup_escaped(s, indicate_escaped)[1]
+
+
+def parse_markup_escaped(s, indicate_escaped=False):
+    """
+    Markup parsed once to formatted text, along with the markup itself,
+    escaped if malformed. Not cached.
+    """
+    s = str(s)
+    try:
+        return s, HTML(s).formatted_text
+    except Exception:
+        s = escape_if_malformed(s, indicate_escaped)
+        return s, HTML(s).formatted_text
+
+
+def join_formatted_lines(lines):
+    """Join lines of formatted text fragments with newlines."""
+    fragments = []
+    for i, line in enumerate(lines):
+        if i:
+            fragments.append(('', '\n'))
+        fragments.extend(line)
+    return FormattedText(fragments)
+
+
 def restart_script():
     os.execl(sys.executable, sys.executable, *sys.argv)
 
@@ -42,7 +42,11 @@ class ArgSpec:
         self._resolve_spec(spec_string)
 
     def parse(self, args_string):
-        astack = list(a for a in args_string.split(' ') if a != '')
+        # A list of arguments is taken as is, such that arguments may contain spaces
+        if isinstance(args_string, str):
+            astack = list(a for a in args_string.split(' ') if a != '')
+        else:
+            astack = list(args_string)
         parsed_pos = []
         remaining_pos = []
         parsed_key = {}
@@ -122,6 +126,22 @@ class ArgSpec:
         kwargs = self.dict_from_parsed(*parsed)
         return func(**kwargs)
 
+    def resolve_keys(self, kwargs):
+        """Resolve flags to their argument names, for key arguments that were passed through another command."""
+        resolved = {}
+        for flag, value in kwargs.items():
+            if flag not in self.keys:
+                resolved[flag] = value
+                continue
+            spec = self.keys[flag]
+            # Flags used with "--" are parsed as sequences by the passing command
+            if not spec.sequence and isinstance(value, tuple):
+                if len(value) > 1:
+                    raise ArgParseError(f'Flag -{flag} expects a single value, got: {value}')
+                value = value[0] if value else True
+            resolved[spec.name.lower()] = value
+        return resolved
+
     def _resolve_spec(self, spec_string):
         self.desc = '__MISSING DESCRIPTION__'
         self.desc_long = ''
@@ -427,6 +447,8 @@ Note that although variable names are printed in caps, they are handled in lower
 
 ### Parsing with the argspec with Argspec.parse(args_string)
 
+The arguments are split on spaces, unless already given as a list of strings (which may contain spaces).
+
 An ArgParseError will be raised during parsing if any of the following occurs:
 - We receive too few positionals
 - We receive too many positionals (if *NAME not specified)
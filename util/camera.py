@@ -1,5 +1,6 @@
 from loguru import logger
 import arrow
+import math
 import numpy as np
 
 from util import adjustable_sigmoid, is_number
@@ -7,13 +8,25 @@ from util.argparse import arg_validation
 from util._3d import latlong_single, latlong, Quaternion as Quat
 
 
+MINIMUM_BUFFER_SIZE = 64
+RESET_ROTATION = np.asarray([1,0,0,0], dtype=np.float64)
+
+
 class Camera:
     def __init__(self):
+        # Version counters are incremented on every change, to be cheaply compared by observers
+        self.pos_version = self.rotation_version = self.zoom_version = 0
+        self._rotation_cache = None
+        self._buffers = {}
+        self.__rotation = None
         self.pos = np.asarray([0,0,0], dtype=np.float64)
         self.reset_zoom()
         self.reset_rotation()
         self.following = None
         self.tracking = None
+        # If tracking is a swivel in progress, rather than a target
+        self.swiveling = False
+        self._copied_modes = None
         self.commands = [
             ('move', self.move),
             ('strafe', self.strafe),
@@ -30,7 +43,7 @@ class Camera:
     @property
     def state(self):
         self.update()
-        return f'{self.pos}{self.rotation}{self.__zoom_level}'
+        return self.pos_version, self.rotation_version, self.zoom_version
 
     def follow(self, callback=None):
         if callback is not None:
@@ -41,13 +54,38 @@ class Camera:
         if callback is not None:
             assert callable(callback)
         self.tracking = callback
+        self.swiveling = False
 
     def update(self):
         if self.following is not None:
-            self.pos = np.copy(self.following())
+            following_pos = self.following()
+            if not np.array_equal(following_pos, self.pos):
+                self.pos = np.copy(following_pos)
         if self.tracking is not None:
             self.look_at_point(self.tracking(), keep_tracking=True)
 
+    def copy_state(self, camera):
+        """
+        Copy the resolved position, rotation, zoom and modes of another camera,
+        along with their versions. Call update on the other camera first. The
+        copy does not follow or track anything itself.
+        """
+        self.pos = np.copy(camera.pos)
+        self.rotation = np.copy(camera.rotation)
+        self._set_zoom(camera.zoom)
+        self.pos_version = camera.pos_version
+        self.rotation_version = camera.rotation_version
+        self.zoom_version = camera.zoom_version
+        self.following = self.tracking = None
+        self._copied_modes = camera.modes
+
+    @property
+    def modes(self):
+        """If the camera is following and if it is tracking."""
+        if self._copied_modes is not None:
+            return self._copied_modes
+        return self.following is not None, self.tracking is not None
+
     def set_position(self, point):
         self.pos = np.asarray(point, dtype=np.float64)
 
@@ -77,21 +115,58 @@ class Camera:
         if disable_follow:
             self.follow(None)
 
+    @property
+    def pos(self):
+        return self.__pos
+
+    @pos.setter
+    def pos(self, pos):
+        self.__pos = pos
+        self.pos_version += 1
+
     @property
     def zoom(self):
         return self.__zoom_level
 
+    def _set_zoom(self, zoom_level):
+        self.__zoom_level = zoom_level
+        self.zoom_version += 1
+
+    @property
+    def rotation(self):
+        return self.__rotation
+
+    @rotation.setter
+    def rotation(self, rotation):
+        if np.array_equal(rotation, self.__rotation):
+            return
+        self.__rotation = rotation
+        self.rotation_version += 1
+
+    @property
+    def rotation_matrix(self):
+        return self._get_rotation_cache()[1]
+
     @property
     def current_axes(self):
-        return Quat.get_rotated_axes(self.rotation)
+        return self._get_rotation_cache()[2]
+
+    def _get_rotation_cache(self):
+        if self._rotation_cache is None or self._rotation_cache[0] != self.rotation_version:
+            matrix = Quat.to_rotation_matrix(self.rotation)
+            matrix.flags.writeable = False
+            # The rows of the rotation matrix are the rotated axes
+            axes = tuple(matrix)
+            self._rotation_cache = self.rotation_version, matrix, axes
+        return self._rotation_cache
 
     def reset_zoom(self):
         """Reset camera zoom"""
-        self.__zoom_level = 1
+        self._set_zoom(1)
 
     def reset_rotation(self, keep_tracking=False):
         """Reset camera rotation"""
-        self.rotation = np.asarray([1,0,0,0], dtype=np.float64)
+        self.rotation = RESET_ROTATION
         if not keep_tracking:
             self.track(None)
 
@@ -114,17 +189,25 @@ class Camera:
         if scale:
             yaw /= self.__zoom_level
             pitch /= self.__zoom_level
+        self.rotation = self._get_rotated(self.rotation, yaw, pitch, roll)
+        if not keep_tracking:
+            self.track(None)
+
+    @staticmethod
+    def _get_rotated(rotation, yaw=0, pitch=0, roll=0):
         if yaw:
-            yaw_qrot = Quat.from_vector_angle(self.current_axes[2], yaw)
-            self.rotation = Quat.multi(self.rotation, yaw_qrot)
+            axes = Quat.to_rotation_matrix(rotation)
+            yaw_qrot = Quat.from_vector_angle(axes[2], yaw)
+            rotation = Quat.multi(rotation, yaw_qrot)
         if pitch:
-            pitch_qrot = Quat.from_vector_angle(self.current_axes[1], pitch)
-            self.rotation = Quat.multi(self.rotation, pitch_qrot)
+            axes = Quat.to_rotation_matrix(rotation)
+            pitch_qrot = Quat.from_vector_angle(axes[1], pitch)
+            rotation = Quat.multi(rotation, pitch_qrot)
         if roll:
-            roll_qrot = Quat.from_vector_angle(self.current_axes[0], roll)
-            self.rotation = Quat.multi(self.rotation, roll_qrot)
-        if not keep_tracking:
-            self.track(None)
+            axes = Quat.to_rotation_matrix(rotation)
+            roll_qrot = Quat.from_vector_angle(axes[0], roll)
+            rotation = Quat.multi(rotation, roll_qrot)
+        return rotation
 
     def yaw(self, yaw):
         """ArgSpec
@@ -170,15 +253,18 @@ class Camera:
         with arg_validation(f'Zoom multiplier must be a non-zero number: {zoom_multiplier}'):
             assert is_number(zoom_multiplier)
             assert zoom_multiplier != 0
-        self.__zoom_level = max(0.5, self.__zoom_level * zoom_multiplier)
+        self._set_zoom(max(0.5, self.__zoom_level * zoom_multiplier))
 
     def look_at_point(self, point, reset_axes=True, keep_tracking=False):
-        if reset_axes:
-            self.reset_rotation(keep_tracking=keep_tracking)
-        rotated = Quat.rotate_vector(point - self.pos, self.rotation)
+        # Resolve the final rotation before setting it, such that it only changes once
+        rotation = RESET_ROTATION if reset_axes else self.rotation
+        rotated = Quat.rotate_vector(point - self.pos, rotation)
         lat, long = latlong_single(rotated)
-        self.rotate(yaw=lat, keep_tracking=keep_tracking)
-        self.rotate(pitch=long, keep_tracking=keep_tracking)
+        rotation = self._get_rotated(rotation, yaw=lat)
+        rotation = self._get_rotated(rotation, pitch=long)
+        self.rotation = rotation
+        if not keep_tracking:
+            self.track(None)
 
     def swivel_to_point(self, point, total_time_ms, smooth=0):
         self.update()
@@ -200,12 +286,39 @@ class Camera:
             return self.pos + current_vector
 
         self.track(swivel_tracking_callback)
+        self.swiveling = True
 
     @property
     def lat_long(self):
         return latlong_single(self.current_axes[0])
 
-    def get_projected_coords(self, points):
-        rv = Quat.rotate_vectors(points - self.pos, self.rotation)
-        ll_coords = latlong(rv)
+    def get_rotated_coords(self, points, dtype=np.float64):
+        """Points relative to the camera position and rotation, in a buffer reused between calls."""
+        relative = self._get_buffer('relative', points.shape, dtype)
+        rotated = self._get_buffer('rotated', points.shape, dtype)
+        np.subtract(points, self.pos, out=relative)
+        np.matmul(relative, self.rotation_matrix.T, out=rotated)
+        return rotated
+
+    def get_latlong(self, rotated):
+        """Longitude, latitude and magnitude of rotated coordinates, in buffers reused between calls."""
+        length = len(rotated)
+        ll_coords = self._get_buffer('latlong', (length, 2), rotated.dtype)
+        magnitude = self._get_buffer('magnitude', (length,), rotated.dtype)
+        latlong(rotated, out=ll_coords, magnitude=magnitude)
+        return ll_coords, magnitude
+
+    def get_projected_coords(self, points, dtype=np.float64):
+        ll_coords, magnitude = self.get_latlong(self.get_rotated_coords(points, dtype))
         return ll_coords
+
+    def _get_buffer(self, name, shape, dtype):
+        # Buffers grow geometrically and are sliced to the requested length
+        key = name, np.dtype(dtype)
+        buffer = self._buffers.get(key)
+        length, *width = shape
+        if buffer is None or len(buffer) < length or buffer.shape[1:] != tuple(width):
+            capacity = max(MINIMUM_BUFFER_SIZE, 2 ** math.ceil(math.log2(max(length, 1))))
+            buffer = np.empty((capacity, *width), dtype=dtype)
+            self._buffers[key] = buffer
+        return buffer[:length]
@@ -1,19 +1,26 @@
 from loguru import logger
 import numpy as np
+from prompt_toolkit.formatted_text import HTML, FormattedText
 
 from util import format_latlong, format_vector, EPSILON
-from util._3d import AXES_VECTORS
+from util._3d import AXES_VECTORS, Frustum
 from util.config import CONFIG_DATA
 
 
-WHITESPACE = '<whitespace> </whitespace>'
+SPACE = ord(' ')
+NEWLINE = ord('\n')
+NO_STYLE = 0
+NO_OID = -1
+# Glyph for the number of objects in a cell, the last one for any more
+DENSITY_GLYPHS = ' 23456789+'
 
 
 class CharMap:
     MINIMUM_SIZE = 3
 
-    def __init__(self, camera, size, show_bar=True, minimum_label_size=4):
+    def __init__(self, camera, size, show_bar=True, minimum_label_size=4, show_density=False):
         self.camera = camera
+        self.show_density = show_density
         self.width, self.height = size
         self.minimum_label_size = minimum_label_size
         self.show_bar = show_bar
@@ -23,18 +30,57 @@ class CharMap:
         if self.width < self.MINIMUM_SIZE or self.height < self.MINIMUM_SIZE:
             raise ValueError(f'CharMap size too small: {self.size} (minimum: {self.MINIMUM_SIZE})')
         self.center = self.width // 2, self.height // 2
-        self.charmap = [[' '] * self.width for _ in range(self.height)]
-        self.camera.update()
+        # Codepoints and style indices of each cell, with a trailing column of newlines
+        self.chars = np.full((self.height, self.width + 1), SPACE, dtype='<u4')
+        self.chars[:, -1] = NEWLINE
+        self.styles = np.full((self.height, self.width + 1), NO_STYLE, dtype=np.uint8)
+        self.occupied = np.zeros((self.height, self.width), dtype=np.bool_)
+        # Object drawn in each cell, for picking
+        self.oids = np.full((self.height, self.width), NO_OID, dtype=np.int32)
+        # Distance of objects drawn in each cell, other characters are in front of everything
+        self.depths = np.full((self.height, self.width), np.inf)
+        # Number of free cells from each cell to the right, updated for changed rows when queried
+        self.free_runs = np.zeros((self.height, self.width), dtype=np.int32)
+        self.stale_rows = np.ones(self.height, dtype=np.bool_)
+        self.style_tags = [()]
+        self.style_ids = {(): NO_STYLE}
+        self.frustum = self.get_frustum()
+        self.dtype = np.dtype(CONFIG_DATA['PROJECTION_DTYPE'])
 
     def draw(self):
-        map_str = '\n'.join(''.join(_) for _ in self.charmap)
+        """Formatted text of the map (and bar), built directly from the cells without parsing markup."""
+        fragments = self.get_fragments()
         if self.show_bar:
-            map_str = f'<map>{map_str}</map>\n<bar>{self.get_bar()}</bar>'
-        return map_str
+            fragments = [*fragments, ('', '\n'), *HTML(f'<bar>{self.get_bar()}</bar>').formatted_text]
+        return FormattedText(fragments)
+
+    def get_fragments(self, style='class:map'):
+        """Formatted text fragments of the map, one per run of cells of the same style."""
+        text = self.chars.tobytes()[:-4].decode('utf-32-le')
+        styles = self.styles.ravel()[:-1]
+        run_starts = np.flatnonzero(np.diff(styles)) + 1
+        starts = [0, *run_starts.tolist()]
+        stops = [*run_starts.tolist(), len(styles)]
+        # Nested tags are listed from the outermost, as parsed by prompt_toolkit
+        run_styles = [','.join((style, *reversed(tags))) for tags in self.style_tags]
+        return [
+            (run_styles[run_style], text[start:stop])
+            for start, stop, run_style in zip(starts, stops, styles[starts].tolist())
+        ]
+
+    def get_style_id(self, tags):
+        if not tags:
+            return NO_STYLE
+        tags = (tags,) if isinstance(tags, str) else tuple(tags)
+        if tags not in self.style_ids:
+            self.style_ids[tags] = len(self.style_tags)
+            self.style_tags.append(tags)
+        return self.style_ids[tags]
 
     def get_bar(self):
-        following = '<grey>FLW</grey>' if self.camera.following is None else '<h2>FLW</h2>'
-        tracking = '<grey>TRK</grey>' if self.camera.tracking is None else '<h2>TRK</h2>'
+        following, tracking = self.camera.modes
+        following = '<h2>FLW</h2>' if following else '<grey>FLW</grey>'
+        tracking = '<h2>TRK</h2>' if tracking else '<grey>TRK</grey>'
         camera_str = f'{following} {tracking}'
         return ' | '.join([
             f'<code>{camera_str}</code>',
@@ -44,15 +90,68 @@ class CharMap:
             f'<code>{self.width}×{self.height}</code>',
         ])
 
-    def add_objects(self, points, icon, tag, label=None):
-        pix_pos = self.get_projected_pixels(points)
-        labels = []
-        for i, x, y in pix_pos:
-            self.write_char(x, y, icon(i), tag(i))
-            if label:
-                labels.append((i, x, y))
-        for i, x, y in labels:
-            self.write_label(x, y, label(i))
+    def add_objects(self, points, icons, tags, label=None, candidates=None, priorities=None):
+        """Project and draw objects, see add_pixels and add_labels."""
+        pix_pos, distances = self.get_projected_pixels(points, candidates, dtype=self.dtype, return_distances=True)
+        self.add_pixels(pix_pos, icons, tags, label, priorities, distances)
+
+    def add_pixels(self, pix_pos, icons, tags, label=None, priorities=None, distances=None):
+        """
+        Draw projected pixels with a depth buffer: each cell shows its
+        nearest object, ties broken by priority. Objects also replace
+        farther objects drawn by previous calls, but never other
+        characters (e.g. labels). With show_density, cells of more than
+        one object show their count instead of the icon.
+        """
+        oids, xs, ys = pix_pos[:, 0], pix_pos[:, 1], pix_pos[:, 2]
+        known_distances = distances is not None
+        if not known_distances:
+            distances = np.full(len(oids), np.inf)
+        cells = ys * self.width + xs
+        sort_keys = [oids]
+        if priorities is not None:
+            sort_keys.append(-priorities[oids])
+        sort_keys.extend((distances, cells))
+        order = np.lexsort(sort_keys)
+        sorted_cells = cells[order]
+        first = np.flatnonzero(np.diff(sorted_cells, prepend=-1))
+        counts = np.diff(first, append=len(order))
+        winners = order[first]
+        oids, xs, ys, depths = oids[winners], xs[winners], ys[winners], distances[winners]
+        # Depth test against previous calls
+        visible = ~self.occupied[ys, xs] | (depths < self.depths[ys, xs])
+        oids, xs, ys, depths, counts = oids[visible], xs[visible], ys[visible], depths[visible], counts[visible]
+        chars = ''.join(icons[oids])
+        if self.show_density:
+            density = np.minimum(counts, len(DENSITY_GLYPHS)) - 1
+            chars = ''.join(DENSITY_GLYPHS[d] if d else c for c, d in zip(chars, density))
+        assert len(chars) == len(oids)
+        unique_tags, tag_indices = np.unique(tags[oids], return_inverse=True)
+        style_ids = np.asarray([self.get_style_id(t) for t in unique_tags], dtype=np.uint8)
+        self.chars[ys, xs] = np.frombuffer(chars.encode('utf-32-le'), dtype='<u4')
+        self.styles[ys, xs] = style_ids[tag_indices.reshape(-1)]
+        self.depths[ys, xs] = depths
+        self.oids[ys, xs] = oids
+        self.occupied[ys, xs] = True
+        self.stale_rows[ys] = True
+        if label:
+            self.add_labels(oids, xs, ys, label, priorities, depths if known_distances else None)
+
+    def add_labels(self, oids, xs, ys, label, priorities=None, distances=None):
+        """
+        Label objects by priority and then nearest first, such that they
+        get the free space first, up to MAX_LABELS per map. The label
+        getter is called with the oid and its distance (if known).
+        """
+        sort_keys = [oids]
+        if distances is not None:
+            sort_keys.append(distances)
+        if priorities is not None:
+            sort_keys.append(-priorities[oids])
+        order = np.lexsort(sort_keys)[:CONFIG_DATA['MAX_LABELS']]
+        dists = [None] * len(order) if distances is None else distances[order].tolist()
+        for i, x, y, dist in zip(oids[order].tolist(), xs[order].tolist(), ys[order].tolist(), dists):
+            self.write_label(x, y, label(i, dist))
 
     def add_object(self, point, icon, tag=None, label=None):
         pix_pos = self.get_projected_pixels(np.asarray([point]))
@@ -100,27 +199,72 @@ class CharMap:
         self.add_object(velocity, '×', 'green', pro_label)
         self.add_object(-velocity, '+', 'red', ret_label)
 
-    def get_projected_pixels(self, points):
-        # Convert 3d position to mercator projection (latitude, longitude)
-        ll_coords = self.camera.get_projected_coords(points)
-        # Stretch to aspect ratio and zoom to get pixel coordinates
-        pix = ll_coords * [1, CONFIG_DATA['ASPECT_RATIO']] * self.camera.zoom
-        # Reverse vertically such that position latitudes are up
-        pix[:, 1] *= -1
+    def get_frustum(self):
+        # Angular extent of the map from the center, with a pixel of margin
+        zoom = self.camera.zoom
+        cx, cy = self.center
+        half_width = max(cx, self.width - 1 - cx) + 1
+        half_height = max(cy, self.height - 1 - cy) + 1
+        return Frustum(
+            half_long=half_width / zoom,
+            half_lat=half_height / (zoom * CONFIG_DATA['ASPECT_RATIO']),
+        )
+
+    def get_visible_cells(self, index):
+        centers = self.camera.get_rotated_coords(index.centers)
+        return self.frustum.contains_spheres(centers, index.radii)
+
+    def get_projected_pixels(self, points, candidates=None, dtype=np.float64, return_distances=False):
+        if candidates is not None:
+            points = points[candidates]
+        # Rotate to camera space and cull points outside the frustum before projecting
+        rotated = self.camera.get_rotated_coords(points, dtype)
+        in_frustum = np.flatnonzero(self.frustum.contains(rotated))
+        # Convert 3d position to mercator projection (longitude, latitude)
+        pix, magnitude = self.camera.get_latlong(rotated[in_frustum])
+        # Stretch to aspect ratio and zoom to get pixel coordinates, reversed
+        # vertically such that position latitudes are up
+        pix *= np.asarray([1, -CONFIG_DATA['ASPECT_RATIO']]) * self.camera.zoom
         # Offset such that pixel 0, 0 is at the center
         pix += self.center
         # Filter coordinates off map
         above_botleft = (pix[:, 0] >= 0) & (pix[:, 1] >= 0)
         below_topright = (pix[:, 0] < self.width-1) & (pix[:, 1] < self.height-1)
-        not_on_camera_pos = (points != self.camera.pos).sum(axis=-1) > 0
+        not_on_camera_pos = magnitude > 0
         valid = above_botleft & below_topright & not_on_camera_pos
-        pix = pix[valid]
+        indices = in_frustum[valid]
+        if candidates is not None:
+            indices = candidates[indices]
         # Add original indices (such that each point is now: index, x_pixel, y_pixel)
-        r = np.concatenate((np.flatnonzero(valid)[:, None], pix), axis=-1)
-        # Round to nearest pixel
-        r = np.asarray(np.round(r), dtype=np.int32)
+        r = np.empty((len(indices), 3), dtype=np.int32)
+        r[:, 0] = indices
+        np.rint(pix[valid], out=r[:, 1:], casting='unsafe')
+        if return_distances:
+            return r, magnitude[valid]
         return r
 
+    def pick(self, x, y, radius=0):
+        """
+        Object drawn at a cell, or else nearest to it within a radius of
+        cells. Searches outward one ring at a time, nearest by on-screen
+        distance (cells are taller than wide), until the rings are farther
+        than the nearest object found.
+        """
+        aspect = CONFIG_DATA['ASPECT_RATIO']
+        best_dist, best_oid = np.inf, None
+        for r in range(radius + 1):
+            # Cells of this ring are at least this far on screen
+            if r * min(aspect, 1) > best_dist:
+                break
+            top, left = max(0, y - r), max(0, x - r)
+            window = self.oids[top:y+r+1, left:x+r+1]
+            wy, wx = np.nonzero(window != NO_OID)
+            if len(wy):
+                dists = np.hypot((wx + left - x) * aspect, wy + top - y)
+                nearest = np.argmin(dists)
+                best_dist, best_oid = dists[nearest], int(window[wy[nearest], wx[nearest]])
+        return best_oid
+
     def write_label(self, x, y, label):
         x += 1  # Offset label to the right of object
         label = f'{label} '  # Add small whitespace as padding
@@ -143,42 +287,48 @@ class CharMap:
             self.insert_label(x, y+idy, label)
 
     def insert_label(self, x, y, name):
-        for i, char in enumerate(name):
-            if x+i+1 >= self.width or self.charmap[y][x+i+1] != ' ':
-                break
-            self.charmap[y][x+i] = char if char != ' ' else WHITESPACE
+        # Write up to the first occupied cell after x, or the edge of the map
+        length = self.count_empty_spaces(x+1, y, len(name))
+        name = name[:length]
+        self.chars[y, x:x+length] = np.frombuffer(name.encode('utf-32-le'), dtype='<u4')
+        self.styles[y, x:x+length] = NO_STYLE
+        self.depths[y, x:x+length] = -np.inf
+        self.occupied[y, x:x+length] = True
+        self.stale_rows[y] = True
 
     def count_empty_spaces(self, x, y, max_chars=float('inf')):
-        if y >= self.height:
+        if y < 0 or y >= self.height:
             return -1
-        total = 0
-        while x < self.width and total < max_chars and self.check_empty(x, y):
-            x += 1
-            total += 1
-        return total
+        if x >= self.width:
+            return 0
+        if self.stale_rows.any():
+            self.update_free_runs()
+        return min(self.free_runs[y, x], max_chars)
+
+    def update_free_runs(self):
+        rows = np.flatnonzero(self.stale_rows)
+        columns = np.arange(self.width)
+        # Index of the next occupied cell at or after each cell, by a running minimum from the right
+        next_occupied = np.where(self.occupied[rows], columns, self.width)
+        next_occupied = np.minimum.accumulate(next_occupied[:, ::-1], axis=1)[:, ::-1]
+        self.free_runs[rows] = next_occupied - columns
+        self.stale_rows[rows] = False
 
     def check_empty(self, x, y):
-        return self.charmap[y][x] == ' '
+        return not self.occupied[y, x]
 
     def write_char(self, x, y, char, tags=None, overwrite=False):
         assert len(char) == 1
-        if tags:
-            if isinstance(tags, str):
-                char = f'<{tags}>{char}</{tags}>'
-            else:
-                char = self.wrap_tags(char, tags)
-        try:
-            if overwrite or self.check_empty(x, y):
-                self.charmap[y][x] = char
-                return True
-        except IndexError as e:
-            m = f'Trying to write to charmap at {x}, {y}; max at {len(charmap[0])-1}, {len(charmap)-1}.'
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            m = f'Trying to write to charmap at {x}, {y}; max at {self.width-1}, {self.height-1}.'
             logger.warning(m)
             raise IndexError(m)
+        if overwrite or self.check_empty(x, y):
+            self.chars[y, x] = ord(char)
+            self.styles[y, x] = self.get_style_id(tags)
+            self.depths[y, x] = -np.inf
+            self.oids[y, x] = NO_OID
+            self.occupied[y, x] = True
+            self.stale_rows[y] = True
+            return True
         return False
-
-    @staticmethod
-    def wrap_tags(s, tags):
-        for tag in tags:
-            s = f'<{tag}>{s}</{tag}>'
-        return s
@@ -7,13 +7,35 @@ from util import file_dump, file_load
 DEFAULT_CONFIG_DATA = {
     # Graphics
     'FPS': 20,
+    'LOGIC_FPS': 20,
+    'IDLE_FPS': 1,
+    'IDLE_DELAY': 2,
+    'SIMULATION_SERVER': 0,
+    'SERVER_SLOT_SIZE': 2**20,
+    'API_SOCKET': '',
+    'API_TIMEOUT': 10,
     'DEFAULT_SIMRATE': -100,
     'ASPECT_RATIO_X': 29,
     'ASPECT_RATIO_Y': 64,
     'CROSSHAIR_COLOR': 'pink',
     'SHOW_LABELS': 0,
+    'SHOW_DENSITY': 0,
+    'MAX_LABELS': 100,
+    'PICK_RADIUS': 3,
     'CAMERA_SMOOTH_TIME': 1000,
     'CAMERA_SMOOTH_CURVE': 0.75,
+    'RENDER_THREAD': 1,
+    'PROJECTION_DTYPE': 'float64',
+    'LOD_PIXELS': 2,
+    'FAR_LAYER_DISTANCE': 10**5,
+    'FAR_LAYER_PARALLAX': 0.25,
+    'SPATIAL_INDEX_MINIMUM': 200_000,
+    'SPATIAL_INDEX_CELL_SIZE': 2 * 10**4,
+    # Logging
+    'LOG_LEVELS': {
+        '': 'DEBUG',
+    },
+    'LOG_SAMPLE_RATE': 100,
     # Spawn
     'SPAWN_OFFSET': {
         'star': 10**6,
@@ -24,6 +46,13 @@ DEFAULT_CONFIG_DATA = {
         'rock': (30, 10),
     },
     'COMPUTER_PLAYERS': 5,
+    # Proximity events
+    'PROXIMITY_RADIUS': {
+        'encounter': 10**3,
+        'arrival': 10**2,
+        'collision': 1,
+    },
+    'PROXIMITY_HORIZON': 100,
     'SILENT_COMMANDS': [
         'gui.prompt.focus',
         'gui.layout.screen',
@@ -60,6 +89,9 @@ DEFAULT_CONFIG_DATA = {
         'J': 'ship.cut',
         'K': 'ship.break --cut',
         '^ l': 'cockpit.labels',
+        '^ d': 'cockpit.density',
+        'p': 'cockpit.pick',
+        'l': 'cockpit.look',
         'up': 'cockpit.move +100',
         '+ up': 'cockpit.move +1',
         'down': 'cockpit.move -100',
@@ -97,7 +129,8 @@ if CONFIG_FILE.is_file() and DELETE_CONFIG_FLAG:
 if not CONFIG_FILE.is_file():
     file_dump(CONFIG_FILE, json.dumps(DEFAULT_CONFIG_DATA, indent=2))
 
-CONFIG_DATA = json.loads(file_load(CONFIG_FILE))
+# Settings files from older versions may be missing newer keys
+CONFIG_DATA = DEFAULT_CONFIG_DATA | json.loads(file_load(CONFIG_FILE))
 logger.debug(f'CONFIG_DATA:\n{CONFIG_DATA}')
 
 CONFIG_DATA['ASPECT_RATIO'] = CONFIG_DATA['ASPECT_RATIO_X'] / CONFIG_DATA['ASPECT_RATIO_Y']
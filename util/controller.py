@@ -51,7 +51,7 @@ class Controller:
         if self.has_command(command):
             raise ValueError(f'Command "{command}" already registered in {self}')
         self.__cache[command] = value
-        logger.debug(f'{self} cached {command}')
+        logger.debug('{} cached {}', self, command)
 
     def register_command(self, command, callback, spec_name=None):
         if self.has_command(command):
@@ -67,7 +67,7 @@ class Controller:
         except ArgParseError as e:
             raise ValueError(f'Command "{command}" failed to resolve docstring as argspec:\n{e.args[0]}')
         self.__commands[command] = callback, argspec
-        logger.info(f'{self} registered command "{command}" to {callback} with argspec: <{argspec.spec}>')
+        logger.info('{} registered command "{}" to {} with argspec: <{}>', self, command, callback, argspec.spec)
 
     def sorted_items(self):
         s = sorted(list(self.__commands.keys()))
@@ -0,0 +1,84 @@
+from loguru import logger
+from collections import deque, Counter
+from itertools import islice
+from threading import Lock
+
+from util import escape_html
+from util.config import CONFIG_DATA
+
+
+LOG_FORMAT = '{level};{name}:{line}:: {message}'
+LOG_TAIL_LINES = 1000
+
+
+class LogTail:
+    """
+    A loguru sink that keeps the last lines of the log in memory, escaped
+    for markup, such that showing the log does not depend on its size.
+    """
+    def __init__(self, max_lines=LOG_TAIL_LINES):
+        self.lines = deque(maxlen=max_lines)
+        self.version = 0
+        # Messages arrive from the logging thread when the sink is enqueued
+        self.lock = Lock()
+        self.listener = None
+
+    def __call__(self, message):
+        lines = [escape_html(line) for line in str(message).rstrip('\n').split('\n')]
+        with self.lock:
+            self.lines.extend(lines)
+            self.version += 1
+        if self.listener is not None:
+            self.listener()
+
+    def tail(self, count):
+        """The last lines, oldest first."""
+        with self.lock:
+            count = min(count, len(self.lines))
+            return list(islice(reversed(self.lines), count))[::-1]
+
+
+class LogSampler:
+    """
+    Thins out high frequency log messages: lets through the first and
+    then every nth call for each key.
+    """
+    def __init__(self, rate=None):
+        self.rate = CONFIG_DATA['LOG_SAMPLE_RATE'] if rate is None else rate
+        self.counts = Counter()
+
+    def __call__(self, key):
+        count = self.counts[key]
+        self.counts[key] += 1
+        return count % max(1, self.rate) == 0
+
+
+def get_log_levels():
+    """
+    Minimum level and per module filter for the log sinks from the
+    LOG_LEVELS config, which maps module names to level names ('' for
+    the default). Messages below the minimum level are dropped before
+    they are formatted.
+    """
+    levels = CONFIG_DATA['LOG_LEVELS']
+    level_filter = {
+        module: level if level is False else logger.level(level).no
+        for module, level in levels.items()
+    }
+    enabled = [level for level in level_filter.values() if level is not False]
+    minimum = min(enabled) if enabled else logger.level('CRITICAL').no
+    return minimum, level_filter
+
+
+def add_log_file(path):
+    """Log to a new file (replacing an existing one), per the LOG_LEVELS config."""
+    if path.is_file():
+        path.unlink()
+    # Sinks write from a background thread, off the event loop
+    log_level, log_filter = get_log_levels()
+    logger.add(path, rotation='5 MB', retention=2, format=LOG_FORMAT,
+        level=log_level, filter=log_filter, enqueue=True)
+
+
+LOG_TAIL = LogTail()
+LOG_SAMPLER = LogSampler()
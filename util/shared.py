@@ -0,0 +1,88 @@
+from loguru import logger
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+
+
+SEQ_SIZE = 8
+SLOT_HEADER_SIZE = 8
+
+
+class SharedFrames:
+    """
+    Double-buffered frames of bytes in shared memory. The writer fills the
+    slot not currently published and then increments the sequence counter,
+    which selects the published slot. Readers copy the published slot and
+    retry if the counter changed while they were copying.
+    """
+    def __init__(self, shm):
+        self.shm = shm
+        self.slot_size = (shm.size - SEQ_SIZE) // 2
+        self.seq_view = np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=0)
+
+    @classmethod
+    def create(cls, slot_size):
+        shm = SharedMemory(create=True, size=SEQ_SIZE + 2 * slot_size)
+        frames = cls(shm)
+        frames.seq_view[0] = 0
+        logger.debug('Created shared frames {} ({} bytes per slot)', frames.name, slot_size)
+        return frames
+
+    @classmethod
+    def attach(cls, name):
+        frames = cls(SharedMemory(name=name))
+        # Only the writer modifies the frames
+        frames.seq_view.flags.writeable = False
+        return frames
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def seq(self):
+        return int(self.seq_view[0])
+
+    @staticmethod
+    def get_frame_size(payload_size):
+        return SLOT_HEADER_SIZE + payload_size
+
+    def _slot_offset(self, seq):
+        return SEQ_SIZE + (seq % 2) * self.slot_size
+
+    def write(self, payload):
+        """Publish a frame, returns False if it does not fit in a slot."""
+        if self.get_frame_size(len(payload)) > self.slot_size:
+            return False
+        seq = self.seq + 1
+        offset = self._slot_offset(seq)
+        header = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        header[0] = len(payload)
+        offset += SLOT_HEADER_SIZE
+        self.shm.buf[offset:offset+len(payload)] = payload
+        self.seq_view[0] = seq
+        return True
+
+    def read(self, last_seq=None):
+        """
+        The sequence number and payload of the published frame, or None if
+        none has been published since last_seq.
+        """
+        while True:
+            seq = self.seq
+            if seq == 0 or seq == last_seq:
+                return None
+            offset = self._slot_offset(seq)
+            payload_size = int(np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=offset)[0])
+            offset += SLOT_HEADER_SIZE
+            if self.get_frame_size(payload_size) <= self.slot_size:
+                payload = bytes(self.shm.buf[offset:offset+payload_size])
+                if self.seq == seq:
+                    return seq, payload
+            # The slot was overwritten while being read
+
+    def close(self):
+        del self.seq_view
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
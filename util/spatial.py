@@ -0,0 +1,40 @@
+from loguru import logger
+import numpy as np
+
+
+class GridIndex:
+    """
+    Static points bucketed into cubic cells of a grid, each bounded by a
+    sphere, such that entire cells can be tested at once.
+    """
+    def __init__(self, points, indices, cell_size):
+        assert len(points) == len(indices)
+        self.cell_size = cell_size
+        keys = np.floor(points / cell_size).astype(np.int64)
+        _, cells = np.unique(keys, axis=0, return_inverse=True)
+        cells = cells.reshape(-1)
+        order = np.argsort(cells, kind='stable')
+        points = points[order]
+        self.indices = np.asarray(indices)[order]
+        self.counts = np.bincount(cells)
+        self.offsets = np.cumsum(self.counts) - self.counts
+        self.centers = np.add.reduceat(points, self.offsets, axis=0) / self.counts[:, None]
+        offsets_from_center = points - np.repeat(self.centers, self.counts, axis=0)
+        dists = np.linalg.norm(offsets_from_center, axis=-1)
+        self.radii = np.maximum.reduceat(dists, self.offsets)
+
+    def query(self, cell_mask):
+        """Indices of all points in the cells of the mask."""
+        counts = self.counts[cell_mask]
+        starts = self.offsets[cell_mask]
+        total = counts.sum()
+        # Concatenate the ranges of each cell
+        run_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self.indices[run_starts + np.arange(total)]
+
+    @property
+    def cell_count(self):
+        return len(self.counts)
+
+    def __len__(self):
+        return len(self.indices)